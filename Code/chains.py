@@ -0,0 +1,155 @@
+import numpy as np
+
+CALL = 0
+PUT = 1
+
+#Columnar NumPy view of one option chain: one array per field, one row per contract
+#Implied vol and delta are filled lazily so only rows the strategy touches get priced, either from the contracts'
+#own price model or, when a pricer is given, solved in one batch from the quotes (see pricing.BlackScholesPricer)
+class ChainSnapshot:
+
+    def __init__(self, optionchain, pricer = None, time = None):
+        self.pricer = pricer
+        self.time = time
+        self.contracts = list(optionchain)
+        n = len(self.contracts)
+        self.strike = np.empty(n)
+        self.right = np.empty(n, dtype = np.int8)
+        self.expiry = np.empty(n, dtype = np.int64)
+        self.bid = np.empty(n)
+        self.ask = np.empty(n)
+        self.underlying_price = np.empty(n)
+        self.expiry_dates = {}
+        for i, x in enumerate(self.contracts):
+            self.strike[i] = x.Strike
+            self.right[i] = int(x.Right)
+            ordinal = x.Expiry.toordinal()
+            self.expiry[i] = ordinal
+            self.expiry_dates[ordinal] = x.Expiry
+            self.bid[i] = x.BidPrice
+            self.ask[i] = x.AskPrice
+            self.underlying_price[i] = x.UnderlyingLastPrice
+        self._iv = np.full(n, np.nan)
+        self._delta = np.full(n, np.nan)
+        self.underlying_symbol = str(self.contracts[0].UnderlyingSymbol) if n > 0 else None
+
+    def __len__(self):
+        return len(self.contracts)
+
+    @property
+    def price(self):
+        return self.underlying_price[0] if len(self.contracts) > 0 else np.nan
+
+    @property
+    def farthest_expiry(self):
+        return int(self.expiry.max()) if len(self.contracts) > 0 else None
+
+    #Implied vol for the given rows, reading each contract at most once
+    def ImpliedVolAt(self, rows):
+        rows = np.atleast_1d(np.asarray(rows, dtype = np.int64))
+        missing = np.unique(rows[np.isnan(self._iv[rows])])
+        if self.pricer is not None:
+            if len(missing) > 0:
+                self._iv[missing] = self.pricer.ImpliedVol(self, missing, self.time)
+            return self._iv[rows]
+        for i in missing:
+            self._iv[i] = float(self.contracts[i].ImpliedVolatility)
+        return self._iv[rows]
+
+    def DeltaAt(self, rows):
+        rows = np.atleast_1d(np.asarray(rows, dtype = np.int64))
+        missing = np.unique(rows[np.isnan(self._delta[rows])])
+        if self.pricer is not None:
+            if len(missing) > 0:
+                self._delta[missing] = self.pricer.Greeks(self, missing, self.time, self.ImpliedVolAt(missing))["delta"]
+            return self._delta[rows]
+        for i in missing:
+            self._delta[i] = float(self.contracts[i].Greeks.Delta)
+        return self._delta[rows]
+
+#Strike-sorted index over a ChainSnapshot, split by right and expiry
+#Rows are sorted once; ATM/OTM/ITM tier lookups are searchsorted calls on the sorted strikes
+class ChainIndex:
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.underlying_price = snapshot.price
+        self.underlying_symbol = snapshot.underlying_symbol
+        self.farthest_expiry = snapshot.farthest_expiry
+        order = np.lexsort((snapshot.strike, snapshot.expiry, snapshot.right))
+        self.order = order
+        self.sorted_strike = snapshot.strike[order]
+        keys = snapshot.right[order].astype(np.int64) * (1 << 32) + snapshot.expiry[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(order) > 0 else np.empty(0, dtype = np.int64)
+        ends = np.r_[starts[1:], len(order)]
+        self.groups = {}
+        for start, end in zip(starts, ends):
+            row = order[start]
+            self.groups[(int(snapshot.right[row]), int(snapshot.expiry[row]))] = (int(start), int(end))
+        self.expiries = sorted(set(key[1] for key in self.groups))
+
+    def _group(self, right, expiry):
+        return self.groups.get((right, self.farthest_expiry if expiry is None else expiry))
+
+    #Snapshot rows for a right and expiry in ascending strike order
+    def Rows(self, right, expiry = None):
+        group = self._group(right, expiry)
+        if group is None:
+            return self.order[0:0]
+        return self.order[group[0]:group[1]]
+
+    #Row of the contract with strike closest to the underlying price
+    def AtmRow(self, right, expiry = None):
+        group = self._group(right, expiry)
+        if group is None:
+            return None
+        start, end = group
+        strikes = self.sorted_strike[start:end]
+        i = int(np.searchsorted(strikes, self.underlying_price, side = "left"))
+        if i == len(strikes) or (i > 0 and self.underlying_price - strikes[i - 1] <= strikes[i] - self.underlying_price):
+            i -= 1
+        return int(self.order[start + i])
+
+    #Position of the nearest strike strictly above / strictly below the underlying price within a group
+    def _above(self, start, end):
+        return int(np.searchsorted(self.sorted_strike[start:end], self.underlying_price, side = "right"))
+
+    def _below(self, start, end):
+        return int(np.searchsorted(self.sorted_strike[start:end], self.underlying_price, side = "left")) - 1
+
+    def _tier(self, right, k, expiry, above):
+        group = self._group(right, expiry)
+        if group is None:
+            return None
+        start, end = group
+        i = self._above(start, end) + k if above else self._below(start, end) - k
+        if i < 0 or i >= end - start:
+            return None
+        return int(self.order[start + i])
+
+    def _contract(self, row):
+        return None if row is None else self.snapshot.contracts[row]
+
+    #k-th (0-based) out of the money row: calls above the underlying price, puts below
+    def OtmRow(self, right, k = 0, expiry = None):
+        return self._tier(right, k, expiry, right == CALL)
+
+    #k-th (0-based) in the money row: calls below the underlying price, puts above
+    def ItmRow(self, right, k = 0, expiry = None):
+        return self._tier(right, k, expiry, right == PUT)
+
+    def Atm(self, right, expiry = None):
+        return self._contract(self.AtmRow(right, expiry))
+
+    def Otm(self, right, k = 0, expiry = None):
+        return self._contract(self.OtmRow(right, k, expiry))
+
+    def Itm(self, right, k = 0, expiry = None):
+        return self._contract(self.ItmRow(right, k, expiry))
+
+    #Average implied vol of the ATM call and put for an expiry
+    def AtmImpliedVol(self, expiry = None):
+        rows = [self.AtmRow(CALL, expiry), self.AtmRow(PUT, expiry)]
+        if None in rows:
+            return np.nan
+        return float(np.mean(self.snapshot.ImpliedVolAt(rows)))
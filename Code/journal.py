@@ -0,0 +1,184 @@
+import os
+import json
+import numpy as np
+
+#Structured trade journal: typed entry / exit / hedge / rejected records appended to a preallocated NumPy record buffer
+#and flushed in bulk as raw records (journal.bin) with a JSON sidecar holding the dtype and the string tables
+#Nothing is formatted while trading; Format renders records only when someone reads them
+
+ENTRY = 1
+EXIT = 2
+HEDGE = 3
+REJECTED = 4
+
+KINDS = {ENTRY: "entry", EXIT: "exit", HEDGE: "hedge", REJECTED: "rejected"}
+
+#Exit reasons
+LONG_BOUND = 1
+SHORT_BOUND = 2
+EXTREME_VOL = 3
+VOL_SPIKE = 4
+STOP_LOSS = 5
+EXPIRY = 6
+VIX = 7
+UNFILLED = 8
+
+REASONS = {0: "", LONG_BOUND: "long_bound", SHORT_BOUND: "short_bound", EXTREME_VOL: "extreme_vol", VOL_SPIKE: "vol_spike",
+           STOP_LOSS: "stop_loss", EXPIRY: "expiry", VIX: "vix", UNFILLED: "unfilled"}
+
+MAX_LEGS = 4
+
+RECORD = np.dtype([
+    ("time", "datetime64[s]"),
+    ("kind", np.uint8),
+    ("reason", np.uint8),
+    ("ticker", np.int16),
+    ("strategy", np.int16),
+    ("quantity", np.int32),
+    ("spread", np.float64),
+    ("vol_spread", np.float64),
+    ("underlying", np.float64),
+    ("margin", np.float64),
+    ("value", np.float64),
+    ("legs", np.int32, (MAX_LEGS,)),
+    ("strikes", np.float32, (MAX_LEGS,)),
+])
+
+NO_LEGS = (-1,) * MAX_LEGS
+NO_STRIKES = (np.nan,) * MAX_LEGS
+
+class Journal:
+
+    #path is the file prefix for <path>.bin / <path>.json; without one, flushed blocks are kept in memory
+    def __init__(self, capacity = 4096, path = None):
+        self.buffer = np.zeros(capacity, dtype = RECORD)
+        self.size = 0
+        self.flushed = 0
+        self.path = path
+        self.blocks = []
+        self.tables = {"tickers": [], "strategies": [], "legs": []}
+        self.ids = {name: {} for name in self.tables}
+        if path is not None:
+            folder = os.path.dirname(os.path.abspath(path))
+            os.makedirs(folder, exist_ok = True)
+            open(path + ".bin", "wb").close()
+
+    def __len__(self):
+        return self.flushed + self.size
+
+    def _id(self, table, value):
+        ids = self.ids[table]
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(self.tables[table])
+            self.tables[table].append(value)
+        return i
+
+    def _legs(self, legs):
+        if not legs:
+            return NO_LEGS, NO_STRIKES
+        legs = legs[:MAX_LEGS]
+        pad = MAX_LEGS - len(legs)
+        ids = tuple(self._id("legs", str(leg)) for leg in legs) + (-1,) * pad
+        strikes = tuple(float(leg.ID.StrikePrice) for leg in legs) + (np.nan,) * pad
+        return ids, strikes
+
+    def _append(self, record):
+        if self.size == len(self.buffer):
+            self.Flush()
+        self.buffer[self.size] = record
+        self.size += 1
+
+    def Entry(self, time, ticker, strategy, legs, quantity, spread, underlying = np.nan, margin = np.nan, value = np.nan, kind = ENTRY, reason = 0):
+        ids, strikes = self._legs(legs)
+        self._append((time, kind, reason, self._id("tickers", ticker), self._id("strategies", strategy), quantity, spread, np.nan, underlying, margin, value, ids, strikes))
+
+    #An entry attempt whose legs did not all fill (and were unwound); kept apart from entries and exits
+    def Rejected(self, time, ticker, strategy, legs, quantity, spread, underlying = np.nan, margin = np.nan, value = np.nan):
+        self.Entry(time, ticker, strategy, legs, quantity, spread, underlying, margin, value, REJECTED, UNFILLED)
+
+    def Exit(self, time, ticker, strategy, legs, reason, spread = np.nan, vol_spread = np.nan, value = np.nan):
+        ids, strikes = self._legs(legs)
+        self._append((time, EXIT, reason, self._id("tickers", ticker), self._id("strategies", strategy), 0, spread, vol_spread, np.nan, np.nan, value, ids, strikes))
+
+    #value is the unhedged delta, quantity the hedge order
+    def Hedge(self, time, ticker, delta, quantity):
+        self._append((time, HEDGE, 0, self._id("tickers", ticker), -1, quantity, np.nan, np.nan, np.nan, np.nan, delta, NO_LEGS, NO_STRIKES))
+
+    #Move the buffered records to the file (or the in-memory block list) in one write
+    def Flush(self):
+        if self.size == 0:
+            return
+        block = self.buffer[:self.size]
+        if self.path is None:
+            self.blocks.append(block.copy())
+        else:
+            with open(self.path + ".bin", "ab") as f:
+                block.tofile(f)
+            self._write_tables()
+        self.flushed += self.size
+        self.size = 0
+
+    def _write_tables(self):
+        meta = {"dtype": np.lib.format.dtype_to_descr(RECORD), "kinds": KINDS, "reasons": REASONS}
+        meta.update(self.tables)
+        with open(self.path + ".json", "w") as f:
+            json.dump(meta, f)
+
+    def Close(self):
+        self.Flush()
+        if self.path is not None:
+            self._write_tables()
+
+    #All records so far, flushed and buffered
+    def Records(self):
+        if self.path is None:
+            blocks = self.blocks
+        else:
+            blocks = [np.fromfile(self.path + ".bin", dtype = RECORD)] if self.flushed else []
+        return np.concatenate(blocks + [self.buffer[:self.size]])
+
+    def Query(self, kind = None, reason = None, ticker = None, strategy = None):
+        records = self.Records()
+        mask = np.ones(len(records), dtype = bool)
+        if kind is not None:
+            mask &= records["kind"] == kind
+        if reason is not None:
+            mask &= records["reason"] == reason
+        if ticker is not None:
+            mask &= records["ticker"] == self.ids["tickers"].get(ticker, -2)
+        if strategy is not None:
+            mask &= records["strategy"] == self.ids["strategies"].get(strategy, -2)
+        return records[mask]
+
+    def Format(self, records = None):
+        records = self.Records() if records is None else records
+        lines = []
+        for r in records:
+            parts = [str(r["time"]).replace("T", " "), KINDS.get(int(r["kind"]), "?"), self.tables["tickers"][r["ticker"]]]
+            if r["strategy"] >= 0:
+                parts.append(self.tables["strategies"][r["strategy"]])
+            if r["reason"]:
+                parts.append("reason=" + REASONS.get(int(r["reason"]), "?"))
+            if r["quantity"]:
+                parts.append("quantity=" + str(int(r["quantity"])))
+            for name in ("spread", "vol_spread", "underlying", "margin", "value"):
+                if not np.isnan(r[name]):
+                    parts.append("{}={:.6g}".format(name, r[name]))
+            legs = [self.tables["legs"][i] for i in r["legs"] if i >= 0]
+            if legs:
+                parts.append("legs=" + "|".join(legs))
+            lines.append(" ".join(parts))
+        return lines
+
+    #Read a journal written to a path prefix
+    @staticmethod
+    def Load(path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        journal = Journal(capacity = 1)
+        journal.tables = {name: meta[name] for name in ("tickers", "strategies", "legs")}
+        journal.ids = {name: {value: i for i, value in enumerate(values)} for name, values in journal.tables.items()}
+        journal.blocks = [np.fromfile(path + ".bin", dtype = RECORD)]
+        journal.flushed = len(journal.blocks[0])
+        return journal
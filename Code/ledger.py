@@ -0,0 +1,154 @@
+import numpy as np
+from pricing import greeks, year_fraction
+
+#Portfolio Greeks per underlying, in shares of the underlying (delta), per dollar move (gamma) and per vol point (vega)
+#Legs are marked with their implied vol when a strategy is entered and priced with it from then on (sticky strike);
+#fills adjust the sums incrementally and an underlying's held legs are repriced, in one batch, only when its
+#gamma-adjusted delta estimate leaves the hedge band
+class GreeksLedger:
+
+    def __init__(self, rate = 0.01, dividend_yield = 0.0, multiplier = 100):
+        self.rate = rate
+        self.dividend_yield = dividend_yield
+        self.multiplier = multiplier
+        self.legs = {}
+        self.held = {}
+        self.shares = {}
+        self.delta = {}
+        self.gamma = {}
+        self.vega = {}
+        self.spot = {}
+        self.hedged = set()
+        self.rejected = {}
+        self.repriced = 0
+
+    def __len__(self):
+        return len(self.hedged)
+
+    #Record a contract's implied vol and current Greeks before it is traded
+    def Mark(self, contract, underlying, iv, spot, now):
+        key = str(contract.Symbol)
+        g = greeks(spot, contract.Strike, year_fraction(now, contract.Expiry), self.rate, self.dividend_yield, iv, int(contract.Right))
+        leg = self.legs.get(key)
+        if leg is None:
+            leg = self.legs[key] = {"underlying": underlying, "quantity": 0, "strike": float(contract.Strike), "expiry": contract.Expiry, "right": int(contract.Right)}
+        old = (leg.get("delta", 0.0), leg.get("gamma", 0.0), leg.get("vega", 0.0))
+        leg.update(iv = float(iv), delta = float(g["delta"]), gamma = float(g["gamma"]), vega = float(g["vega"]))
+        if leg["quantity"] != 0:
+            self._add(underlying, leg["quantity"], leg["delta"] - old[0], leg["gamma"] - old[1], leg["vega"] - old[2])
+
+    def _add(self, underlying, quantity, delta, gamma, vega):
+        n = quantity * self.multiplier
+        self.delta[underlying] = self.delta.get(underlying, 0.0) + n * delta
+        self.gamma[underlying] = self.gamma.get(underlying, 0.0) + n * gamma
+        self.vega[underlying] = self.vega.get(underlying, 0.0) + n * vega
+
+    #Apply a fill: shares of an underlying, or contracts of a marked leg (unmarked contracts carry no Greeks)
+    def Fill(self, symbol, quantity, is_option):
+        key = str(symbol)
+        if not is_option:
+            self.shares[key] = self.shares.get(key, 0) + quantity
+            return
+        leg = self.legs.get(key)
+        if leg is None:
+            return
+        underlying = leg["underlying"]
+        leg["quantity"] += quantity
+        self._add(underlying, quantity, leg.get("delta", 0.0), leg.get("gamma", 0.0), leg.get("vega", 0.0))
+        held = self.held.setdefault(underlying, set())
+        if leg["quantity"] != 0:
+            held.add(key)
+        else:
+            held.discard(key)
+            del self.legs[key]
+
+    #Hedge an underlying's delta while it is watched
+    def Watch(self, underlying):
+        self.hedged.add(underlying)
+
+    def Unwatch(self, underlying):
+        self.hedged.discard(underlying)
+        self.spot.pop(underlying, None)
+        self.rejected.pop(underlying, None)
+
+    #Drop marked legs of an underlying that never filled (an entry whose orders were rejected)
+    def Prune(self, underlying):
+        for key in [key for key, leg in self.legs.items() if leg["underlying"] == underlying and leg["quantity"] == 0]:
+            del self.legs[key]
+
+    #A hedge order for the underlying was rejected: leave it unhedged for the rest of the day instead of resending
+    #the order every minute
+    def Reject(self, underlying, today):
+        self.rejected[underlying] = today
+
+    #Recompute an underlying's sums from its held legs at a new spot, one vectorized Black-Scholes call
+    def Reprice(self, underlying, spot, now):
+        keys = list(self.held.get(underlying, ()))
+        self.spot[underlying] = spot
+        self.delta[underlying] = self.gamma[underlying] = self.vega[underlying] = 0.0
+        if not keys:
+            return
+        legs = [self.legs[key] for key in keys]
+        T = [year_fraction(now, leg["expiry"]) for leg in legs]
+        g = greeks(spot, [leg["strike"] for leg in legs], T, self.rate, self.dividend_yield, [leg["iv"] for leg in legs], [leg["right"] for leg in legs])
+        for i, leg in enumerate(legs):
+            leg["delta"], leg["gamma"], leg["vega"] = float(g["delta"][i]), float(g["gamma"][i]), float(g["vega"][i])
+        quantity = np.array([leg["quantity"] for leg in legs]) * self.multiplier
+        self.delta[underlying] = float(quantity @ g["delta"])
+        self.gamma[underlying] = float(quantity @ g["gamma"])
+        self.vega[underlying] = float(quantity @ g["vega"])
+        self.repriced += 1
+
+    #Net delta in shares, options plus stock; without a spot the value at the last reprice
+    def NetDelta(self, underlying, spot = None):
+        delta = self.delta.get(underlying, 0.0) + self.shares.get(underlying, 0)
+        last = self.spot.get(underlying)
+        if spot is None or last is None:
+            return delta
+        return delta + self.gamma.get(underlying, 0.0) * (spot - last)
+
+    #Watched underlyings, with their spot, that were never priced or whose estimated net delta is outside the band,
+    #skipping those with a hedge rejected today
+    def Due(self, spots, band, today):
+        due = []
+        for underlying in sorted(self.hedged):
+            if self.rejected.get(underlying) == today:
+                continue
+            spot = spots(underlying)
+            if spot > 0 and (underlying not in self.spot or abs(self.NetDelta(underlying, spot)) > band):
+                due.append((underlying, spot))
+        return due
+
+    #Share orders that bring every watched underlying whose net delta left the band back to delta neutral
+    def Rebalance(self, spots, band, now):
+        orders = []
+        for underlying, spot in self.Due(spots, band, now.date()):
+            self.Reprice(underlying, spot, now)
+            delta = self.NetDelta(underlying)
+            if abs(delta) > band:
+                orders.append((underlying, -int(round(delta)), delta))
+        return orders
+
+    def Summary(self):
+        return {underlying: {"delta": round(self.NetDelta(underlying), 2), "gamma": round(self.gamma.get(underlying, 0.0), 4), "vega": round(self.vega.get(underlying, 0.0), 2)}
+                for underlying in sorted(set(self.delta) | set(self.shares))}
+
+    #Checkpoint of the held legs with their Greeks, the per-underlying sums and spots, stock and watched underlyings
+    def State(self):
+        fields = ("underlying", "quantity", "strike", "expiry", "right", "iv", "delta", "gamma", "vega")
+        legs = {key: [leg["expiry"].isoformat() if name == "expiry" else leg[name] for name in fields] for key, leg in self.legs.items() if leg["quantity"] != 0}
+        return {"legs": legs, "shares": self.shares, "delta": self.delta, "gamma": self.gamma, "vega": self.vega, "spot": self.spot,
+                "hedged": sorted(self.hedged), "rejected": {underlying: today.isoformat() for underlying, today in self.rejected.items()},
+                "repriced": self.repriced}
+
+    def Restore(self, state, parse_time):
+        self.__init__(self.rate, self.dividend_yield, self.multiplier)
+        for key, (underlying, quantity, strike, expiry, right, iv, delta, gamma, vega) in state["legs"].items():
+            self.legs[key] = {"underlying": underlying, "quantity": quantity, "strike": strike, "expiry": parse_time(expiry), "right": right,
+                              "iv": iv, "delta": delta, "gamma": gamma, "vega": vega}
+            self.held.setdefault(underlying, set()).add(key)
+        for name in ("shares", "delta", "gamma", "vega", "spot"):
+            setattr(self, name, dict(state[name]))
+        self.hedged = set(state["hedged"])
+        self.rejected = {underlying: parse_time(today).date() for underlying, today in state["rejected"].items()}
+        self.repriced = state["repriced"]
@@ -1,7 +1,16 @@
 import numpy as np
 import datetime
-import statistics
+from collections import defaultdict
 from QuantConnect.Securities.Option import OptionPriceModels
+from volatility import RealizedVolatility, RollingZScore
+from chains import ChainSnapshot, ChainIndex, CALL, PUT
+from pricing import BlackScholesPricer, PricingReport
+from triggers import StopTriggers, ExpiryQueue
+from positions import PositionBook
+from profiler import Profiler
+from strategies import Compile
+from ledger import GreeksLedger
+from journal import Journal, LONG_BOUND, SHORT_BOUND, EXTREME_VOL, VOL_SPIKE, STOP_LOSS, EXPIRY, VIX, UNFILLED
 
 class OptionTrading(QCAlgorithm):
 
@@ -10,199 +19,326 @@ class OptionTrading(QCAlgorithm):
         self.SetEndDate(2017, 12, 31)
         self.SetCash(1000000)  # Set Strategy Cash
         
-        #Stock/Option Universe
-        self.stock_list = ["SPY"]
+        #Option pricing: "FD" uses LEAN's CrankNicolsonFD model on every contract, "BS" solves Black-Scholes IV and Greeks
+        #in batches for the contracts the strategy reads; pricing_report_on compares the two in FD mode
+        self.price_model = self.getParameter("price_model", "FD")
+        self.pricer = BlackScholesPricer(rate = 0.01) if self.price_model == "BS" else None
+        self.pricing_report_on = self.getParameter("pricing_report_on", False)
+        self.pricing_report = PricingReport(BlackScholesPricer(rate = 0.01))
         
-        self.equity = self.AddEquity("SPY", Resolution.Minute)
-        #self.equity = self.AddEquity("SPY", Resolution.Minute)
-        #self.equity = self.AddEquity("QQQ", Resolution.Minute)
-        #self.equity = self.AddEquity("IWM", Resolution.Minute)
+        #Per-stage timers, counters and OnData latency histograms, summarized as JSON at the end of the run
+        self.profiler = Profiler(self.getParameter("profile_on", False))
+        
+        #Structured journal of entries, exits and hedges; journal_path writes it to <path>.bin / <path>.json,
+        #journal_log_on formats it into the log at the end of the run
+        self.journal = Journal(path = self.getParameter("journal_path", "") or None)
+        self.journal_log_on = self.getParameter("journal_log_on", False)
         
-        optionA = self.AddOption("SPY")
-        optionA.SetFilter(-15, 15, TimeSpan.FromDays(3),TimeSpan.FromDays(10)) #Set Options Universe
-        optionA.PriceModel = OptionPriceModels.CrankNicolsonFD()
-        '''
-        optionB = self.AddOption("DIA")
-        optionB.SetFilter(-15, 15, TimeSpan.FromDays(3),TimeSpan.FromDays(10))
-        optionB.PriceModel = OptionPriceModels.CrankNicolsonFD()
-        optionC = self.AddOption("QQQ")
-        optionC.SetFilter(-15, 15, TimeSpan.FromDays(3),TimeSpan.FromDays(10))
-        optionC.PriceModel = OptionPriceModels.CrankNicolsonFD()
-        optionD = self.AddOption("IWM")
-        optionD.SetFilter(-15, 15, TimeSpan.FromDays(3),TimeSpan.FromDays(10))
-        optionD.PriceModel = OptionPriceModels.CrankNicolsonFD()
-        '''
         self.SetWarmUp(TimeSpan.FromDays(60))
         
         #Lookback period for historic volatility in days
-        self.HVPeriod = 30
-        self.shortHVPeriod = 3
+        self.HVPeriod = self.getParameter("HVPeriod", 30)
+        self.shortHVPeriod = self.getParameter("shortHVPeriod", 3)
+        self.extraHVPeriods = []
+        
+        #Set spread bounds for trade execution, per ticker with a fallback for the rest of the universe
+        #A parameter with the bound's name overrides it for every ticker
+        self.ShortBound = self.getBoundParameter("ShortBound", 1, {"SPY": .247})
+        self.LongBound = self.getBoundParameter("LongBound", 1)
+        self.ExtremeVolBoundLower = self.getBoundParameter("ExtremeVolBoundLower", -1)
+        self.ExtremeVolBoundUpper = self.getBoundParameter("ExtremeVolBoundUpper", 1)
         
-        #Set spread bounds for trade execution
-        self.ShortBound = {"SPY": .247, "QQQ": 1, "DIA": 1, "IWM": 1}
-        self.LongBound = {"SPY": 1, "QQQ": 1, "DIA": 1, "IWM": 1}
-        self.ExtremeVolBoundLower = {"SPY": -1, "QQQ": -1, "DIA": -1, "IWM": -1}
-        self.ExtremeVolBoundUpper = {"SPY": 1, "QQQ": 1, "DIA": 1, "IWM": 1}
+        #Trade Pause due to Vol
+        self.vol_spike = 1
         
         #type of strategy
-        self.LongStrat = "Straddle"
+        self.LongStrat = self.getParameter("LongStrat", "Straddle")
         #self.LongStrat = "Strangle"
-        self.ShortStrat = "Short Straddle"
+        self.ShortStrat = self.getParameter("ShortStrat", "Short Straddle")
         #self.ShortStrat = "Butterfly"
         #self.ShortStrat = "Condor"
         #self.ShortStrat = "Iron Condor"
         #self.ShortStrat = "Iron Butterfly"
         
-        #status of strategy
-        #"None" for not invested yet, or "Straddle", "Strangle", "Butterfly", "Condor", Iron Butterfly", "Iron Condor"
-        self.status = {"SPY": "None", "QQQ": "None", "DIA": "None", "IWM": "None"}
-        self.option_symbols = {"SPY": (None, None), "QQQ": (None, None), "DIA": (None, None), "IWM": (None, None)}
-        self.expiration = {"SPY": None, "QQQ": None, "DIA": None, "IWM": None}
+        #Share of remaining margin committed to the Condor and Iron strategies
+        self.MarginUseRatio = self.getParameter("MarginUseRatio", .025)
         
-        #Trade Pause due to Vol
-        self.vol_spike = {"SPY": 1, "QQQ": 1, "DIA": 1, "IWM": 1}
+        #Leg specs of every strategy compiled into chain index selectors (see strategies.py); legs are sent as one combo
+        #order per trade, or as separate market orders with combo_orders_on off
+        self.strategies = Compile()
+        self.combo_orders_on = self.getParameter("combo_orders_on", True)
+        
+        #Option universe: every contract 3 to 10 days out within 15 strikes of ATM, or with atm_universe_on only the
+        #farthest of those expiries within strike_band strikes of ATM, the contracts the strategies can trade
+        self.atm_universe_on = self.getParameter("atm_universe_on", False)
+        self.strike_band = self.getParameter("strike_band", 6)
+        self.min_expiry = TimeSpan.FromDays(3)
+        self.max_expiry = TimeSpan.FromDays(10)
+        
+        #Stock/Option Universe, e.g. stock_list=SPY,QQQ,DIA,IWM
+        #Every underlying gets a position record holding its status ("None" for not invested yet, or "Straddle",
+        #"Strangle", "Butterfly", "Condor", Iron Butterfly", "Iron Condor"), legs, trading pause and bounds
+        self.stock_list = [stock.strip() for stock in self.getParameter("stock_list", "SPY").split(",") if stock.strip()]
+        self.positions = PositionBook()
+        self.realized_vol = {}
+        for stock in self.stock_list:
+            self.AddUnderlying(stock)
+        
+        #Expiry dates of open positions, popped by date at 15:40
+        self.expiries = ExpiryQueue()
         
         #Trade Pause Length
-        self.days_pause_left = {"SPY": 0, "QQQ": 0, "DIA": 0, "IWM": 0}
-        self.pause_length = 3
+        self.pause_length = self.getParameter("pause_length", 3)
         
-        #Stop-Loss Triggers
-        self.stop_loss = {"SPY": None, "QQQ": None, "DIA": None, "IWM": None}
-        self.stop_loss_percentage_bound = .6
+        #Stop-Loss Triggers, keyed by the legs they watch and checked only when one of those legs is quoted
+        self.stop_triggers = StopTriggers()
+        self.stop_loss_percentage_bound = self.getParameter("stop_loss_percentage_bound", .6)
         self.stop_percentage = 1 + self.stop_loss_percentage_bound
         
         #Vix Indicator
-        self.vix_indicator_on = False
+        self.vix_indicator_on = self.getParameter("vix_indicator_on", False)
         self.vix_spike = False
         self.vix_lookback_period = 30
-        self.vix_stdevs = 2.25
-        self.past_vix = None
-        self.AddEquity("VIXY", Resolution.Minute)
+        self.vix_stdevs = self.getParameter("vix_stdevs", 2.25)
+        self.vix_symbol = "VIXY"
+        self.AddEquity(self.vix_symbol, Resolution.Minute)
+        self.vix_zscore = RollingZScore(self.vix_lookback_period)
+        self.Consolidate(self.vix_symbol, Resolution.Daily, self.OnDailyBar)
         self.vix_pause = 3
         
-        #Delta-Hedge
-        self.delta_hedge_on = False
+        #Delta-Hedge: portfolio Greeks of the hedged strategies' legs are kept per underlying from fills and repriced only
+        #when the estimated net delta leaves delta_band (in shares); the underlyings outside it are rebalanced together
+        self.delta_hedge_on = self.getParameter("delta_hedge_on", False)
+        self.delta_band = self.getParameter("delta_band", 500.0)
+        self.ledger = GreeksLedger(rate = 0.01)
+    
+    #Read an optimization parameter, falling back to the hand-tuned default and casting to its type
+    def getParameter(self, name, default):
+        value = self.GetParameter(name)
+        if value is None or value == "":
+            return default
+        if isinstance(default, bool):
+            return value.strip().lower() in ("true", "1", "yes")
+        return type(default)(value)
+    
+    def getBoundParameter(self, name, default, overrides = {}):
+        value = self.GetParameter(name)
+        if value is None or value == "":
+            return defaultdict(lambda: default, overrides)
+        return defaultdict(lambda: float(value))
+    
+    #Subscribe an underlying and its options and register its position record and volatility estimator
+    def AddUnderlying(self, stock):
+        self.AddEquity(stock, Resolution.Minute)
+        option = self.AddOption(stock)
+        if self.atm_universe_on:
+            option.SetFilter(self.SelectAtmUniverse)
+        else:
+            option.SetFilter(-15, 15, self.min_expiry, self.max_expiry) #Set Options Universe
+        if self.price_model == "FD":
+            option.PriceModel = OptionPriceModels.CrankNicolsonFD()
+        self.realized_vol[stock] = RealizedVolatility([self.HVPeriod, self.shortHVPeriod] + self.extraHVPeriods)
+        self.Consolidate(stock, Resolution.Daily, self.OnDailyBar)
+        return self.positions.Register(stock, self.LongBound[stock], self.ShortBound[stock], self.ExtremeVolBoundLower[stock], self.ExtremeVolBoundUpper[stock], self.vol_spike)
     
-    #Function to return Daily Historical Close Data
-    def getHistoricalDailyCloseData(self, symbol, days):
-        bars = []
+    #Universe filter keeping the target expiry (the farthest in the window) and a strike band around ATM, reapplied
+    #as the underlying moves
+    def SelectAtmUniverse(self, universe):
+        return universe.Expiration(self.min_expiry, self.max_expiry).Contracts(self.FarthestExpiry).Strikes(-self.strike_band, self.strike_band)
+    
+    def FarthestExpiry(self, symbols):
+        symbols = list(symbols)
+        if len(symbols) == 0:
+            return symbols
+        expiry = max(symbol.ID.Date for symbol in symbols)
+        return [symbol for symbol in symbols if symbol.ID.Date == expiry]
+    
+    #Seed the volatility estimators and VIX z-score with a single History call once warm-up is done
+    def OnWarmupFinished(self):
+        days = max([self.realized_vol[stock].size + 1 for stock in self.realized_vol] + [self.vix_zscore.period])
+        self.profiler.Count("history_calls")
         slices = self.History(days, Resolution.Daily)
+        for stock in self.realized_vol:
+            self.realized_vol[stock].Reset()
+        self.vix_zscore.Reset()
+        vix_closes = []
         for s in slices:
-            bars.append(s.Bars[symbol].Close)
-        return bars
+            for stock in self.realized_vol:
+                if s.Bars.ContainsKey(stock):
+                    self.realized_vol[stock].Update(s.Bars[stock].Close)
+            if s.Bars.ContainsKey(self.vix_symbol):
+                vix_closes.append(s.Bars[self.vix_symbol].Close)
+        for close in vix_closes[-self.vix_zscore.period:]:
+            self.vix_zscore.Update(close)
+    
+    #Derived strategy state for checkpoints: volatility windows, VIX z-score, position status, legs and pauses, expiry
+    #dates, stop levels and the Greeks ledger; legs are stored as OSI tickers
+    def CaptureState(self):
+        return {
+            "realized_vol": {stock: self.realized_vol[stock].State() for stock in self.realized_vol},
+            "vix_zscore": self.vix_zscore.State(),
+            "positions": self.positions.State(),
+            "expiries": self.expiries.State(),
+            "stop_triggers": self.stop_triggers.State(),
+            "ledger": self.ledger.State(),
+        }
+    
+    #Resume from a checkpoint; volatility windows it cannot supply (new tickers, longer lookbacks) are reseeded from History
+    def RestoreState(self, state):
+        parse = SymbolRepresentation.ParseOptionTickerOSI
+        self.positions.Restore(state["positions"], parse)
+        self.expiries.Restore(state["expiries"])
+        self.stop_triggers.Restore(state["stop_triggers"], parse)
+        if "ledger" in state:
+            self.ledger.Restore(state["ledger"], datetime.datetime.fromisoformat)
+        restored = self.vix_zscore.Restore(state["vix_zscore"])
+        for stock in self.realized_vol:
+            restored = stock in state["realized_vol"] and self.realized_vol[stock].Restore(state["realized_vol"][stock]) and restored
+        if not restored:
+            self.OnWarmupFinished()
+    
+    #Feed each consolidated daily close to the underlying's volatility estimator or the VIX z-score
+    def OnDailyBar(self, bar):
+        if self.IsWarmingUp:
+            return
+        stock = bar.Symbol.Value
+        if stock in self.realized_vol:
+            self.realized_vol[stock].Update(bar.Close)
+        if stock == self.vix_symbol:
+            self.vix_zscore.Update(bar.Close)
+    
+    #Journal the exit of an open strategy, liquidate the underlying and unwind the held legs as one batch, drop the
+    #position's expiry and stop-loss triggers and optionally pause trading; an unfilled entry is journaled as rejected
+    #instead of as an entry and exit
+    def ClosePosition(self, position, reason, pause = None, spread = np.nan, vol_spread = np.nan, value = np.nan):
+        started = self.profiler.Start()
+        if position.IsOpen and reason != UNFILLED:
+            self.journal.Exit(self.Time, position.ticker, position.status, position.legs, reason, spread, vol_spread, value)
+        self.ledger.Unwatch(position.ticker)
+        self.Liquidate(position.ticker)
+        held = [(leg, -int(self.Portfolio[leg].Quantity)) for leg in position.legs if self.Portfolio[leg].Invested]
+        if len(held) > 0:
+            self.SubmitOrders(held, "Liquidated")
+        self.expiries.Remove(position.ticker)
+        self.stop_triggers.Remove(position.ticker)
+        position.Close()
+        if pause is not None:
+            position.pause = pause
+        self.profiler.Stop("liquidate", started)
     
     #Function that returns historical annual volatility with specified lookback period
     def CalculateHistoricVol(self, symbol, days):
-        historic_data = self.getHistoricalDailyCloseData(symbol, days)
-        returns_list = []
-        for j in range(1, len(historic_data)):
-            returns_list.append(np.log(historic_data[j]) - np.log(historic_data[j - 1])) #Log difference to approximate percentage
-        daily_std = np.std(returns_list)
-        annual_vol = daily_std * (252 ** .5)
+        annual_vol = self.realized_vol[symbol].Value(days)
         rounded_vol = round(annual_vol, 4)
         return rounded_vol
         
-    #Delta Hedging Function
-    def DeltaHedge(self, underlying_symbol, contractA, contractB, quantity, status):
-        current_delta = (contractA.Greeks.Delta * quantity) + (contractA.Greeks.Delta * quantity)
-        if status == "short":
-            current_delta = current_delta * -1
-        self.Log("Unhedged Delta: " + str(current_delta))
-        hedge_order_number = -1 * int(round(current_delta))
-        self.MarketOrder(underlying_symbol, hedge_order_number)
-        self.Log("Order " + str(hedge_order_number) + " to Hedge")    
+    def OnOrderEvent(self, orderEvent):
+        if orderEvent.Status == OrderStatus.Filled or orderEvent.Status == OrderStatus.PartiallyFilled:
+            self.ledger.Fill(orderEvent.Symbol, orderEvent.FillQuantity, orderEvent.Symbol.SecurityType == SecurityType.Option)
+        if orderEvent.Status == OrderStatus.Filled:
+            self.profiler.Count("orders")
+        
+    def OnEndOfAlgorithm(self):
+        if self.pricing_report_on and self.pricer is None:
+            self.Log("Pricing tolerance BS vs FD: " + str(self.pricing_report.Summary()))
+        if self.profiler.enabled:
+            self.Log("Profile: " + self.profiler.ToJson())
+        if self.delta_hedge_on:
+            self.Log("Portfolio Greeks: " + str(self.ledger.Summary()) + ", repriced " + str(self.ledger.repriced) + " times")
+        self.journal.Close()
+        if self.journal_log_on:
+            for line in self.journal.Format():
+                self.Log(line)
+        
+    #Delta Hedging Function: one pass over every hedged underlying, sending a share order for each one whose net delta
+    #left the band to bring it back to neutral; filled hedges are journaled, a rejected one is not retried until the
+    #next day
+    def DeltaHedge(self):
+        started = self.profiler.Start()
+        for ticker, quantity, delta in self.ledger.Rebalance(lambda ticker: self.Securities[ticker].Price, self.delta_band, self.Time):
+            ticket = self.MarketOrder(ticker, quantity, tag = "Delta Hedge")
+            if ticket.Status == OrderStatus.Filled:
+                self.journal.Hedge(self.Time, ticker, delta, int(ticket.QuantityFilled))
+            else:
+                self.ledger.Reject(ticker, self.Time.date())
+        self.profiler.Stop("hedge", started)
             
     def OnData(self, slice):
         
         if self.IsWarmingUp: 
             return
+        started = self.profiler.Start()
+        t = started
         
         #Liquidate and Stop Trading Short Strategy if VIX Spikes
-        if self.vix_indicator_on:
-            if self.past_vix == None or (self.Time.hour == 16 and self.Time.minute == 0):
-                self.past_vix = self.getHistoricalDailyCloseData("VIXY", Resolution.Daily)
-            avg_past_vix = statistics.mean(self.past_vix)
-            std_past_vix = statistics.stdev(self.past_vix)
-            current_vix = self.Securities["VIXY"].Price
-            standard_devs = (current_vix - avg_past_vix) / std_past_vix 
+        if self.vix_indicator_on and self.vix_zscore.IsReady:
+            current_vix = self.Securities[self.vix_symbol].Price
+            standard_devs = self.vix_zscore.Score(current_vix)
             if (standard_devs > self.vix_stdevs):
                 self.vix_spike = True
             else:
                 self.vix_spike = False
             if self.vix_spike:
-                for stock in self.stock_list:
-                    if self.status[stock] == self.ShortStrat:
-                        self.Log("Liquidate " + stock + " due to VIX indicator at " + str(standard_devs) + "Std Devs")
-                        self.Liquidate(stock)
-                        self.Liquidate(self.option_symbols[stock][0])
-                        self.Liquidate(self.option_symbols[stock][1])
-                        self.expiration[stock] = None
-                        self.status[stock] = "None"
-                    self.days_pause_left[stock] = self.vix_pause    
+                for position in self.positions:
+                    if position.status == self.ShortStrat:
+                        self.ClosePosition(position, VIX, value = standard_devs)
+                    position.pause = self.vix_pause    
+            t = self.profiler.Stop("vix", t)
                 
         
         #Liquidate on Expiration Day
         if self.Time.hour == 15 and self.Time.minute == 40:
-            for stock in self.stock_list:
-                if self.expiration[stock] == self.Time.strftime("%m/%d/%Y"):
-                    self.Log("Expire: " + self.Time.strftime("%m/%d/%Y") + stock)
-                    self.Liquidate(stock)
-                    self.Liquidate(self.option_symbols[stock][0])
-                    self.Liquidate(self.option_symbols[stock][1])
-                    self.expiration[stock] = None
-                    self.status[stock] = "None"
-                    self.days_pause_left[stock] = self.vix_pause
+            for stock in self.expiries.Due(self.Time.date()):
+                self.ClosePosition(self.positions[stock], EXPIRY, self.vix_pause)
+            t = self.profiler.Stop("expiry", t)
                     
                     
-        #Liquidate on Stop-Loss
-        for stock in self.stock_list:
-            if (self.status[stock] == self.ShortStrat) and (self.stop_loss != None):
-                current_value = self.Securities[self.option_symbols[stock][0]].AskPrice + self.Securities[self.option_symbols[stock][1]].AskPrice
-                if current_value > self.stop_loss[stock]:
-                    self.Liquidate(stock)
-                    self.Liquidate(self.option_symbols[stock][0])
-                    self.Liquidate(self.option_symbols[stock][1])
-                    self.expiration[stock] = None
-                    self.status[stock] = "None"
-                    self.days_pause_left[stock] = self.pause_length
-                    self.stop_loss[stock] = None
-                    self.Log("Stop Loss Triggered for " + stock)
+        #Liquidate on Stop-Loss, for positions with a leg quoted this minute
+        if len(self.stop_triggers) > 0:
+            for stock in self.stop_triggers.Breached(slice.QuoteBars, self.Securities):
+                self.ClosePosition(self.positions[stock], STOP_LOSS, self.pause_length)
+            t = self.profiler.Stop("stops", t)
         
         #Scan option information per hour
         if self.Time.minute == 0:
         
-            for chain in slice.OptionChains:
+            t = self.profiler.Start()
+            chains = slice.OptionChains
+            t = self.profiler.Stop("chains", t)
+            for chain in chains:
                 
-                optionchain = chain.Value
+                #Columnar snapshot of the chain, indexed by right and expiry; lookups default to the farthest expiry
+                t = self.profiler.Start()
+                snapshot = ChainSnapshot(chain.Value, self.pricer, self.Time)
+                t = self.profiler.Stop("snapshot", t)
+                self.profiler.Count("contracts_scanned", len(snapshot))
+                index = ChainIndex(snapshot)
+                t = self.profiler.Stop("sort", t)
+                self.profiler.Count("sorts")
+                if index.farthest_expiry is None:
+                    continue
+                
+                underlying_symbol = index.underlying_symbol
+                position = self.positions.get(underlying_symbol)
+                if position is None:
+                    self.Log("Key Not Found: " + underlying_symbol)
+                    continue
                 
-                #Find options which has longest time to maturity
-                farthest_expiry = max([x.Expiry for x in optionchain])
-                optionchain = [x for x in optionchain if x.Expiry == farthest_expiry]
-    
                 #Differentiate calls and puts
-                calls = [x for x in optionchain if x.Right == 0]
-                puts = [x for x in optionchain if x.Right == 1]
-                if len(calls) == 0 or len(puts) == 0: 
-                    return
+                if len(index.Rows(CALL)) == 0 or len(index.Rows(PUT)) == 0: 
+                    continue
                 
                 #Calculate call and put implied volatility
-                call_ATM = sorted(calls, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                put_ATM = sorted(puts, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                calls_iv = float(call_ATM.ImpliedVolatility)
-                puts_iv = float(put_ATM.ImpliedVolatility)
-                
-                underlying_symbol = str(call_ATM.UnderlyingSymbol)
-                
-                if not(underlying_symbol in self.status.keys()):
-                    self.Log("Key Not Found: " + underlying_symbol)
-                    continue
+                avg_call_put_iv = index.AtmImpliedVol()
+                if self.pricing_report_on and self.pricer is None:
+                    self.pricing_report.Add(snapshot, [index.AtmRow(CALL), index.AtmRow(PUT)], self.Time)
+                t = self.profiler.Stop("pricing", t)
                 
                 #Check if Trading Pause is Still in Effect for the Ticker
-                if self.days_pause_left[underlying_symbol] > 0 and self.Time.hour == 16 and self.Time.minute == 0:
-                    self.days_pause_left[underlying_symbol] -= 1
+                if position.pause > 0 and self.Time.hour == 16 and self.Time.minute == 0:
+                    position.pause -= 1
                     continue
-                    
-                if self.days_pause_left[underlying_symbol] > 0:
+                if position.pause > 0:
                     continue
                 
                 #calculate historic volatility
@@ -214,277 +350,83 @@ class OptionTrading(QCAlgorithm):
                 historic_vol_spread = round(historic_vol_spread, 4)
                 
                 #Compare implied vol with historic vol
-                avg_call_put_iv = np.mean([calls_iv, puts_iv])
                 hv_iv_spread = historic_vol - avg_call_put_iv #Spread = HV - IV
                 hv_iv_spread = round(hv_iv_spread, 4)
+                t = self.profiler.Stop("signals", t)
                 
                 #Liquidate Current Holdings if Bounds are Breached
-                if self.status[underlying_symbol] == self.LongStrat and (hv_iv_spread < self.LongBound[underlying_symbol]):
-                    self.Liquidate(underlying_symbol)
-                    self.Liquidate(self.option_symbols[underlying_symbol][0])
-                    self.Liquidate(self.option_symbols[underlying_symbol][1])
-                    self.Log("Liquidated Long Bound Breached " + underlying_symbol + str(hv_iv_spread))
-                    self.status[underlying_symbol] = "None"
-                    self.expiration[underlying_symbol] = None
+                if position.status == self.LongStrat and (hv_iv_spread < position.long_bound):
+                    self.ClosePosition(position, LONG_BOUND, spread = hv_iv_spread, vol_spread = historic_vol_spread)
                     continue
             
-                if self.status[underlying_symbol] == self.ShortStrat and (hv_iv_spread > self.ShortBound[underlying_symbol]):
-                    self.Liquidate(underlying_symbol)
-                    self.Liquidate(self.option_symbols[underlying_symbol][0])
-                    self.Liquidate(self.option_symbols[underlying_symbol][1])
-                    self.Log("Liquidated Short Bound Breached: " + underlying_symbol + str(hv_iv_spread))
-                    self.status[underlying_symbol] = "None"
-                    self.expiration[underlying_symbol] = None
+                if position.status == self.ShortStrat and (hv_iv_spread > position.short_bound):
+                    self.ClosePosition(position, SHORT_BOUND, spread = hv_iv_spread, vol_spread = historic_vol_spread)
                     continue
                 
-                if (hv_iv_spread < self.ExtremeVolBoundLower[underlying_symbol]) or (hv_iv_spread > self.ExtremeVolBoundUpper[underlying_symbol]):
-                    self.Liquidate(underlying_symbol)
-                    self.Liquidate(self.option_symbols[underlying_symbol][0])
-                    self.Liquidate(self.option_symbols[underlying_symbol][1])
-                    self.Log("Extreme Vol Liquidate: " + underlying_symbol + str(hv_iv_spread))
-                    self.status[underlying_symbol] = "None"
-                    self.days_pause_left[underlying_symbol] = self.pause_length
-                    self.expiration[underlying_symbol] = None
+                if (hv_iv_spread < position.lower_bound) or (hv_iv_spread > position.upper_bound):
+                    self.ClosePosition(position, EXTREME_VOL, self.pause_length, hv_iv_spread, historic_vol_spread)
                     continue
                 
-                if (historic_vol_spread > self.vol_spike[underlying_symbol]):
-                    self.Liquidate(underlying_symbol)
-                    self.Liquidate(self.option_symbols[underlying_symbol][0])
-                    self.Liquidate(self.option_symbols[underlying_symbol][1])
-                    self.Log("Extreme Vol Spike Liquidate: " + underlying_symbol + str(hv_iv_spread))
-                    self.Log("Near Minus Long Term Vol: " + str(historic_vol_spread))
-                    self.status[underlying_symbol] = "None"
-                    self.days_pause_left[underlying_symbol] = self.pause_length
-                    self.expiration[underlying_symbol] = None
+                if (historic_vol_spread > position.vol_spike):
+                    self.ClosePosition(position, VOL_SPIKE, self.pause_length, hv_iv_spread, historic_vol_spread)
                     continue
                 
                 #Control unit to choose strategy based on HV-IV spread if no holdings
                 strategy = "None"
-                if (hv_iv_spread > self.LongBound[underlying_symbol]) and (hv_iv_spread <= self.ExtremeVolBoundUpper[underlying_symbol]):
+                if (hv_iv_spread > position.long_bound) and (hv_iv_spread <= position.upper_bound):
                     strategy = self.LongStrat
-                elif (hv_iv_spread < self.ShortBound[underlying_symbol]) and (hv_iv_spread >= self.ExtremeVolBoundLower[underlying_symbol]):
+                elif (hv_iv_spread < position.short_bound) and (hv_iv_spread >= position.lower_bound):
                     strategy = self.ShortStrat
-               
-    
-                ## Long a Straddle (long at the money call and put)
-                if strategy == "Straddle" and self.status[underlying_symbol] == "None":
-              
-                    call_ATM = sorted(calls, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                    self.Debug(call_ATM)
-                    put_ATM = sorted(puts, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                    self.Debug(put_ATM)
-                    # trade the contracts with the farthest expiration
-                    call_symbol = call_ATM.Symbol
-                    put_symbol = put_ATM.Symbol
-                    
-                    quantity = min(self.CalculateOrderQuantity(call_symbol, 0.025), self.CalculateOrderQuantity(put_symbol, 0.025))
-                    #if quantity ==0 : continue
-                    self.MarketOrder(call_symbol, quantity)
-                    self.MarketOrder(put_symbol, quantity)
-                    self.option_symbols[underlying_symbol]= (call_symbol, put_symbol)
-                    self.status[underlying_symbol] = strategy
-                    self.expiration[underlying_symbol] = call_ATM.Expiry.strftime("%m/%d/%Y")
-                    self.Log("Enter Trade: " + underlying_symbol + " " + strategy)
-                    self.Log("Current Vol Spread: " + str(hv_iv_spread))
-                    #self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                    #self.Log( "call option strike price is "+str(call_ATM.Strike) + " stock price is "+str(call_ATM.UnderlyingLastPrice))
-                    #self.Log( "put option strike price is "+str(put_ATM.Strike) + " stock price is "+str(put_ATM.UnderlyingLastPrice))  
-                    if self.delta_hedge_on:
-                        self.DeltaHedge(underlying_symbol, call_ATM, put_ATM, quantity, "long") 
-                        
-                ## Short a Straddle (short at the money call and put)
-                if strategy == "Short Straddle" and self.status[underlying_symbol] == "None":
-              
-                    call_ATM = sorted(calls, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                    put_ATM = sorted(puts, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-    
-                    # trade the contracts with the farthest expiration
-                    call_symbol = call_ATM.Symbol
-                    put_symbol = put_ATM.Symbol
-                    
-                    quantity = -1 * min(self.CalculateOrderQuantity(call_symbol, 0.025), self.CalculateOrderQuantity(put_symbol, 0.025))
-                    #quantity = -10
-                    self.MarketOrder(call_symbol, quantity)
-                    self.MarketOrder(put_symbol, quantity)
-                    self.option_symbols[underlying_symbol] = (call_symbol, put_symbol)
-                    self.expiration[underlying_symbol] = call_ATM.Expiry.strftime("%m/%d/%Y")
-                    self.status[underlying_symbol] = strategy
-                    self.stop_loss[underlying_symbol] = self.stop_percentage * (call_ATM.AskPrice + put_ATM.AskPrice) 
-                    self.Log("Enter Trade: " + underlying_symbol + " " + strategy)
-                    self.Log("Current HV-IV Vol Spread: " + str(hv_iv_spread))
-                    self.Log("Trade Equity: " + str(quantity * (call_ATM.AskPrice + put_ATM.AskPrice)))
-                    self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                    #self.Log( "call option strike price is "+str(call_ATM.Strike) + " stock price is "+str(call_ATM.UnderlyingLastPrice))
-                    #self.Log( "put option strike price is "+str(put_ATM.Strike) + " stock price is "+str(put_ATM.UnderlyingLastPrice)) 
-                    if self.Portfolio[put_symbol].Invested == False:
-                        self.Liquidate(underlying_symbol)
-                        self.Liquidate(self.option_symbols[underlying_symbol][0])
-                        self.Liquidate(self.option_symbols[underlying_symbol][1])
-                        self.status[underlying_symbol] = "None"
-                        self.expiration[underlying_symbol] = None
-                        continue
-                    if self.delta_hedge_on:
-                        self.DeltaHedge(underlying_symbol, call_ATM, put_ATM, quantity, "short")
-                    
-                ## Long Strangle (long out of the money call/put)
-                if strategy == "Strangle":
-                    tier_call = 1
-                    tier_put = 1
-    
-                    calls_OTM = [x for x in calls if x.UnderlyingLastPrice - x.Strike < 0]
-                    puts_OTM = [x for x in puts if x.UnderlyingLastPrice - x.Strike > 0]
-                    if (len(calls_OTM)<tier_call+1) or (len(puts_OTM)<tier_put+1):
-                        return
-                    call_OTM = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call]
-                    put_OTM = sorted(puts_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_put]
-                    
-                    call_symbol = call_OTM.Symbol
-                    put_symbol = put_OTM.Symbol
-    
-                    if self.status=="None":
-                        #quantity = int(self.Portfolio.MarginRemaining * self.MarginUseRatio / (call_OTM.AskPrice + put_OTM.AskPrice) / 100)
-                        #quantity = -1 * min(self.CalculateOrderQuantity(call_symbol, 0.025), self.CalculateOrderQuantity(put_symbol, 0.025))
-                        quantity = -1
-                        if quantity == 0 : continue
-                        self.MarketOrder(call_symbol, quantity)
-                        self.MarketOrder(put_symbol, quantity)
-                        self.status = strategy
-                        self.Log(strategy)
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                        self.Log( "call option strike price is "+str(call_OTM.Strike) + " stock price is "+str(call_OTM.UnderlyingLastPrice))
-                        self.Log( "put option strike price is "+str(put_OTM.Strike) + " stock price is "+str(put_OTM.UnderlyingLastPrice))   
                 
-                ## Long a Butterfly (buy one ITM and OTM call option and sell two ATM call options)        
-                if strategy == "Butterfly":
-                    tier_call_OTM = 5
-                    tier_call_ITM = 5
-    
-                    call_ATM = sorted(calls, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                    calls_OTM = [x for x in calls if x.UnderlyingLastPrice - x.Strike < 0]
-                    calls_ITM = [x for x in calls if x.UnderlyingLastPrice - x.Strike > 0]
-                    if (len(calls_OTM)<tier_call_OTM+1) or (len(calls_ITM)<tier_call_ITM+1):
-                        return
-                    call_OTM = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM]
-                    call_ITM = sorted(calls_ITM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_ITM]
-                    call_OTM_symbol = call_OTM.Symbol
-                    call_ITM_symbol = call_ITM.Symbol
-                    call_ATM_symbol = call_ATM.Symbol
-    
-                    if self.status=="None":
-                        #quantity = int(self.Portfolio.MarginRemaining * self.MarginUseRatio 
-                        #/ (call_OTM.AskPrice + call_ITM.AskPrice + 2*call_ATM.BidPrice) / 100)
-                        quantity = 1
-                        if quantity ==0 : continue
-                        self.MarketOrder(call_OTM_symbol, quantity)
-                        self.MarketOrder(call_ITM_symbol, quantity)          
-                        self.MarketOrder(call_ATM_symbol, -quantity*2)
-                        self.status = strategy
-                        self.Log(strategy)
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                        self.Log( "OTM call option strike price is "+str(call_OTM.Strike) + " stock price is "+str(call_OTM.UnderlyingLastPrice))
-                        self.Log( "ITM call option strike price is "+str(call_ITM.Strike) + " stock price is "+str(call_ITM.UnderlyingLastPrice))
-                        self.Log( "ATM call option strike price is "+str(call_ATM.Strike) + " stock price is "+str(call_ATM.UnderlyingLastPrice))
+                if strategy != "None":
+                    self.EnterStrategy(strategy, position, index, hv_iv_spread)
+                    t = self.profiler.Stop("entry", t)
         
-                ## Long a Condor (buy a call with strike price A (the lowest strike), sell a call with strike price B (the second lowest)
-                ## sell a call with strike price C (the second highest), buy a call with strike price D (the highest strike))        
-                if strategy == "Condor":
-                    tier_call_OTM_buy = 2
-                    tier_call_OTM_sell = 1
-                    tier_call_ITM_buy = 2
-                    tier_call_ITM_sell = 1
-                    
-                    calls_OTM = [x for x in calls if x.UnderlyingLastPrice - x.Strike < 0]
-                    calls_ITM = [x for x in calls if x.UnderlyingLastPrice - x.Strike > 0]
-                    call_OTM_buy = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM_buy]
-                    call_OTM_sell = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM_sell]
-                    call_ITM_buy = sorted(calls_ITM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_ITM_buy]
-                    call_ITM_sell = sorted(calls_ITM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_ITM_sell]               
-                    call_OTM_buy_symbol = call_OTM_buy.Symbol
-                    call_OTM_sell_symbol = call_OTM_sell.Symbol
-                    call_ITM_buy_symbol = call_ITM_buy.Symbol
-                    call_ITM_sell_symbol = call_ITM_sell.Symbol
-    
-                    if self.status=="None":
-                        quantity = int(self.Portfolio.MarginRemaining * self.MarginUseRatio 
-                        / (call_OTM_buy.AskPrice + call_ITM_buy.AskPrice + call_OTM_sell.BidPrice + call_ITM_sell.BidPrice) / 100)
-                        if quantity ==0 : continue
-                        self.MarketOrder(call_OTM_buy_symbol, quantity)
-                        self.MarketOrder(call_OTM_sell_symbol, -quantity)
-                        self.MarketOrder(call_ITM_buy_symbol, quantity)
-                        self.MarketOrder(call_ITM_sell_symbol, -quantity)
-                        self.status = strategy
-                        self.Log(strategy)
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                        self.Log(" stock price is "+str(call_OTM_buy.UnderlyingLastPrice))
-                        self.Log( "call_OTM_buy strike price is "+str(call_OTM_buy.Strike))
-                        self.Log( "call_OTM_sell strike price is "+str(call_OTM_sell.Strike))
-                        self.Log( "call_ITM_buy strike price is "+str(call_ITM_buy.Strike))
-                        self.Log( "call_ITM_sell strike price is "+str(call_ITM_sell.Strike))
-    
-                ## Long a Iron Butterfly (buy one ITM, buy one OTM call option, buy one ATM call and sell one ATM call)        
-                if strategy == "Iron Butterfly":
-                    tier_call_OTM = 1
-                    tier_call_ITM = 1
-                    
-                    call_ATM = sorted(calls, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[0]
-                    calls_OTM = [x for x in calls if x.UnderlyingLastPrice - x.Strike < 0]
-                    calls_ITM = [x for x in calls if x.UnderlyingLastPrice - x.Strike > 0]
-                    call_OTM = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM]
-                    call_ITM = sorted(calls_ITM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_ITM]
-                    call_OTM_symbol = call_OTM.Symbol
-                    call_ITM_symbol = call_ITM.Symbol
-                    call_ATM_symbol = call_ATM.Symbol
+        #Rebalance the delta of hedged positions, a gamma-adjusted estimate per underlying unless it leaves the band
+        if self.delta_hedge_on and len(self.ledger) > 0:
+            self.DeltaHedge()
+        
+        self.profiler.Bar("scan" if self.Time.minute == 0 else ("expiry" if self.Time.hour == 15 and self.Time.minute == 40 else "minute"), started)
     
-                    if self.status=="None":
-                        quantity = int(self.Portfolio.MarginRemaining * self.MarginUseRatio 
-                        / (call_OTM.AskPrice + call_ITM.AskPrice +call_ATM.AskPrice + call_ATM.BidPrice) / 100)
-                        if quantity ==0 : continue
-                        self.MarketOrder(call_OTM_symbol, -quantity)
-                        self.MarketOrder(call_ITM_symbol, quantity)          
-                        self.MarketOrder(call_ATM_symbol, quantity)
-                        self.MarketOrder(call_ATM_symbol, -quantity)
-                        self.status = strategy
-                        
-                        self.Log(strategy)
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                        self.Log( "OTM call option strike price is "+str(call_OTM.Strike) + " stock price is "+str(call_OTM.UnderlyingLastPrice))
-                        self.Log( "ITM call option strike price is "+str(call_ITM.Strike) + " stock price is "+str(call_ITM.UnderlyingLastPrice))
-                        self.Log( "ATM call option strike price is "+str(call_ATM.Strike) + " stock price is "+str(call_ATM.UnderlyingLastPrice))
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))    
-                        
-                ## Long a Iron Condor (buy one ITM, but one OTM call option, buy one ATM call and sell one ATM call) 
-                if strategy == "Iron Condor":
-                    tier_call_OTM_buy = 1
-                    tier_call_OTM_sell = 0
-                    tier_put_OTM_buy = 1
-                    tier_put_OTM_sell = 0
-                    
-                    calls_OTM = [x for x in calls if x.UnderlyingLastPrice - x.Strike < 0]
-                    puts_OTM = [x for x in puts if x.UnderlyingLastPrice - x.Strike > 0]
-                    call_OTM_buy = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM_buy]
-                    call_OTM_sell = sorted(calls_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_call_OTM_sell]
-                    put_OTM_buy = sorted(puts_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_put_OTM_buy]
-                    put_OTM_sell = sorted(puts_OTM, key = lambda x: abs(x.UnderlyingLastPrice - x.Strike))[tier_put_OTM_sell]
-                    
-                    call_OTM_buy_symbol = call_OTM_buy.Symbol
-                    call_OTM_sell_symbol = call_OTM_sell.Symbol
-                    put_OTM_buy_symbol = put_OTM_buy.Symbol
-                    put_OTM_sell_symbol = put_OTM_sell.Symbol
+    #Open the chosen strategy on an underlying with no holdings: select its legs at the farthest expiry, size it once and
+    #submit every leg as one batch; a batch that does not fill completely is unwound
+    def EnterStrategy(self, strategy, position, index, hv_iv_spread):
+        compiled = self.strategies.get(strategy)
+        if compiled is None or position.IsOpen:
+            return
+        rows = compiled.Rows(index)
+        if rows is None:
+            return
+        contracts = [index.snapshot.contracts[row] for row in rows]
+        quantity = compiled.Quantity(self, contracts, self.MarginUseRatio)
+        if quantity <= 0:
+            return
+        orders = compiled.Orders(contracts, quantity)
+        hedged = compiled.spec.hedge and self.delta_hedge_on
+        if hedged:
+            iv = index.snapshot.ImpliedVolAt(rows)
+            iv = np.where(np.isfinite(iv) & (iv > 0), iv, index.AtmImpliedVol())
+            for contract, contract_iv in zip(contracts, iv):
+                self.ledger.Mark(contract, position.ticker, contract_iv, contract.UnderlyingLastPrice, self.Time)
+        self.SubmitOrders(orders)
+        underlying_symbol = position.ticker
+        position.Open(strategy, [symbol for symbol, _ in orders])
+        self.expiries.Add(underlying_symbol, contracts[0].Expiry.date())
+        if compiled.spec.stop:
+            self.stop_triggers.Add(underlying_symbol, position.legs, self.stop_percentage * sum(contract.AskPrice for contract in contracts))
+        record = (self.Time, underlying_symbol, strategy, position.legs, quantity, hv_iv_spread, contracts[0].UnderlyingLastPrice,
+            self.Portfolio.MarginRemaining, compiled.Premium(contracts, quantity))
+        if not all(self.Portfolio[symbol].Invested for symbol in position.legs):
+            self.journal.Rejected(*record)
+            self.ClosePosition(position, UNFILLED)
+            self.ledger.Prune(underlying_symbol)
+            return
+        self.journal.Entry(*record)
+        if hedged:
+            self.ledger.Watch(underlying_symbol)
     
-                    if self.status=="None":
-                        quantity = int(self.Portfolio.MarginRemaining * self.MarginUseRatio 
-                        / (call_OTM_buy.AskPrice + call_OTM_sell.BidPrice +put_OTM_buy.AskPrice + put_OTM_sell.BidPrice) / 100)
-                        if quantity ==0 : continue
-                        self.MarketOrder(call_OTM_sell_symbol, -quantity)
-                        self.MarketOrder(put_OTM_sell_symbol, -quantity)
-                        self.MarketOrder(call_OTM_buy_symbol, quantity)
-                        self.MarketOrder(put_OTM_buy_symbol, quantity)
-                        self.status = strategy
-                        
-                        self.Log(strategy)
-                        self.Log("Current Margin Remaining is "+str(self.Portfolio.MarginRemaining))
-                        self.Log(" stock price is "+str(call_OTM_buy.UnderlyingLastPrice))
-                        self.Log( "OTM call option to buy strike price is "+str(call_OTM_buy.Strike))
-                        self.Log( "OTM call option to sell strike price is "+str(call_OTM_sell.Strike))
-                        self.Log( "OTM put option to buy strike price is "+str(put_OTM_buy.Strike))
-                        self.Log( "OTM put option to sell strike price is "+str(put_OTM_sell.Strike))
\ No newline at end of file
+    #Send (symbol, quantity) orders as one combo order, or one market order each with combo_orders_on off
+    def SubmitOrders(self, orders, tag = ""):
+        if self.combo_orders_on and len(orders) > 1:
+            return self.ComboMarketOrder([Leg.Create(symbol, quantity) for symbol, quantity in orders], 1, tag = tag)
+        return [self.MarketOrder(symbol, quantity, tag = tag) for symbol, quantity in orders]
@@ -0,0 +1,70 @@
+#Per-underlying strategy state: one slotted record per ticker holding the open strategy, its legs, the trading pause
+#and the spread bounds, so a universe of hundreds of underlyings is one dict lookup per chain
+#Expiry dates and stop levels of open positions live in the trigger indices (see triggers.py), keyed by the same ticker
+class Position:
+
+    __slots__ = ("ticker", "status", "legs", "pause", "vol_spike", "long_bound", "short_bound", "lower_bound", "upper_bound")
+
+    def __init__(self, ticker, long_bound, short_bound, lower_bound, upper_bound, vol_spike):
+        self.ticker = ticker
+        self.status = "None"
+        self.legs = ()
+        self.pause = 0
+        self.vol_spike = vol_spike
+        self.long_bound = long_bound
+        self.short_bound = short_bound
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    @property
+    def IsOpen(self):
+        return self.status != "None"
+
+    def Open(self, status, legs):
+        self.status = status
+        self.legs = tuple(legs)
+
+    def Close(self):
+        self.status = "None"
+        self.legs = ()
+
+#Position records keyed by underlying ticker, registered as underlyings are added to the universe
+class PositionBook:
+
+    def __init__(self):
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return iter(self.positions.values())
+
+    def __contains__(self, ticker):
+        return ticker in self.positions
+
+    def __getitem__(self, ticker):
+        return self.positions[ticker]
+
+    def get(self, ticker):
+        return self.positions.get(ticker)
+
+    def Register(self, ticker, long_bound, short_bound, lower_bound, upper_bound, vol_spike):
+        if ticker not in self.positions:
+            self.positions[ticker] = Position(ticker, long_bound, short_bound, lower_bound, upper_bound, vol_spike)
+        return self.positions[ticker]
+
+    def Tickers(self):
+        return list(self.positions)
+
+    #Checkpoint of the trading state (status, legs as symbol strings, pause); bounds come from the parameters
+    def State(self):
+        return {ticker: [p.status, [str(leg) for leg in p.legs], p.pause] for ticker, p in self.positions.items()}
+    
+    def Restore(self, state, parse):
+        for ticker, (status, legs, pause) in state.items():
+            position = self.positions.get(ticker)
+            if position is None:
+                continue
+            position.Open(status, [parse(leg) for leg in legs])
+            position.pause = pause
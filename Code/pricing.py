@@ -0,0 +1,145 @@
+import math
+import numpy as np
+
+#Vectorized Black-Scholes pricing, Greeks and implied volatility for whole chains at once
+#Used instead of the CrankNicolsonFD price model: only contracts the strategy reads get solved, in one batch
+
+try:
+    from scipy.special import ndtr as norm_cdf
+except ImportError:
+    #Abramowitz-Stegun 26.2.17, absolute error below 7.5e-8
+    def norm_cdf(x):
+        x = np.asarray(x, dtype = np.float64)
+        t = 1.0 / (1.0 + 0.2316419 * np.abs(x))
+        poly = t * (0.319381530 + t * (-0.356563782 + t * (1.781477937 + t * (-1.821255978 + t * 1.330274429))))
+        upper = 1.0 - norm_pdf(x) * poly
+        return np.where(x >= 0, upper, 1.0 - upper)
+
+def norm_pdf(x):
+    return np.exp(-0.5 * np.asarray(x, dtype = np.float64) ** 2) / math.sqrt(2 * math.pi)
+
+def _d1_d2(S, K, T, r, q, sigma):
+    sqrt_t = np.sqrt(T)
+    d1 = (np.log(S / K) + (r - q + 0.5 * sigma * sigma) * T) / (sigma * sqrt_t)
+    return d1, d1 - sigma * sqrt_t
+
+#right is 0 for calls and 1 for puts, as in OptionRight
+def price(S, K, T, r, q, sigma, right):
+    S, K, T, sigma, right = np.broadcast_arrays(*[np.asarray(a, dtype = np.float64) for a in (S, K, T, sigma, right)])
+    d1, d2 = _d1_d2(S, K, T, r, q, sigma)
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    call = S * df_q * norm_cdf(d1) - K * df_r * norm_cdf(d2)
+    put = K * df_r * norm_cdf(-d2) - S * df_q * norm_cdf(-d1)
+    return np.where(right == 0, call, put)
+
+def greeks(S, K, T, r, q, sigma, right):
+    S, K, T, sigma, right = np.broadcast_arrays(*[np.asarray(a, dtype = np.float64) for a in (S, K, T, sigma, right)])
+    d1, d2 = _d1_d2(S, K, T, r, q, sigma)
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(T)
+    is_call = right == 0
+    delta = np.where(is_call, df_q * norm_cdf(d1), df_q * (norm_cdf(d1) - 1.0))
+    gamma = df_q * pdf / (S * sigma * sqrt_t)
+    vega = S * df_q * pdf * sqrt_t / 100.0
+    theta_call = -S * df_q * pdf * sigma / (2 * sqrt_t) - r * K * df_r * norm_cdf(d2) + q * S * df_q * norm_cdf(d1)
+    theta_put = -S * df_q * pdf * sigma / (2 * sqrt_t) + r * K * df_r * norm_cdf(-d2) - q * S * df_q * norm_cdf(-d1)
+    theta = np.where(is_call, theta_call, theta_put) / 365.0
+    return {"delta": delta, "gamma": gamma, "vega": vega, "theta": theta}
+
+#Safeguarded Newton: Newton steps on sigma, bisection on the [lo, hi] bracket whenever a step leaves it
+#Prices outside the no-arbitrage bounds give NaN
+def implied_vol(option_price, S, K, T, r, q, right, tol = 1e-6, max_iter = 50, lo = 1e-4, hi = 5.0):
+    P, S, K, T, right = np.broadcast_arrays(*[np.asarray(a, dtype = np.float64) for a in (option_price, S, K, T, right)])
+    P, S, K, T, right = [a.copy() for a in (P, S, K, T, right)]
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    intrinsic = np.where(right == 0, np.maximum(S * df_q - K * df_r, 0.0), np.maximum(K * df_r - S * df_q, 0.0))
+    upper = np.where(right == 0, S * df_q, K * df_r)
+    valid = (P > intrinsic) & (P < upper) & (T > 0) & (S > 0) & (K > 0)
+    low = np.full(P.shape, lo)
+    high = np.full(P.shape, hi)
+    sigma = np.clip(np.sqrt(2 * math.pi / np.maximum(T, 1e-12)) * P / np.maximum(S, 1e-12), 0.05, 2.0)
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        s = sigma[idx]
+        diff = price(S[idx], K[idx], T[idx], r, q, s, right[idx]) - P[idx]
+        done = np.abs(diff) < tol
+        high[idx] = np.where(diff > 0, s, high[idx])
+        low[idx] = np.where(diff <= 0, s, low[idx])
+        vega = S[idx] * df_q[idx] * norm_pdf(_d1_d2(S[idx], K[idx], T[idx], r, q, s)[0]) * np.sqrt(T[idx])
+        with np.errstate(divide = "ignore", invalid = "ignore", over = "ignore"):
+            step = s - diff / vega
+        bad = ~np.isfinite(step) | (step <= low[idx]) | (step >= high[idx])
+        step = np.where(bad, 0.5 * (low[idx] + high[idx]), step)
+        sigma[idx] = np.where(done, s, step)
+        active[idx[done]] = False
+    return np.where(valid, sigma, np.nan)
+
+#Year fraction from now to the 16:00 close of the expiry date
+def year_fraction(now, expiry):
+    close = expiry.replace(hour = 16, minute = 0, second = 0, microsecond = 0)
+    return max((close - now).total_seconds(), 60.0) / (365.0 * 24 * 3600)
+
+#Lazy chain pricer handed to ChainSnapshot: solves IV from mid quotes and Greeks from that IV for requested rows only
+class BlackScholesPricer:
+
+    def __init__(self, rate = 0.01, dividend_yield = 0.0):
+        self.rate = rate
+        self.dividend_yield = dividend_yield
+        self.solved = 0
+
+    #Spot, strike, time to expiry and right of snapshot rows; the quote mid is only needed by the IV solve
+    def _inputs(self, snapshot, rows, now):
+        T = np.array([year_fraction(now, snapshot.expiry_dates[int(e)]) for e in snapshot.expiry[rows]])
+        return snapshot.underlying_price[rows], snapshot.strike[rows], T, snapshot.right[rows]
+
+    def ImpliedVol(self, snapshot, rows, now):
+        bid, ask = snapshot.bid[rows], snapshot.ask[rows]
+        mid = np.where((bid > 0) & (ask > 0), 0.5 * (bid + ask), np.nan)
+        S, K, T, right = self._inputs(snapshot, rows, now)
+        self.solved += len(rows)
+        return implied_vol(mid, S, K, T, self.rate, self.dividend_yield, right)
+
+    #Same solve for quotes outside a ChainSnapshot, e.g. the offline event timeline replaying the algorithm's signal
+    def QuoteImpliedVol(self, bid, ask, S, K, expiry, right, now):
+        bid, ask = np.asarray(bid, dtype = np.float64), np.asarray(ask, dtype = np.float64)
+        mid = np.where((bid > 0) & (ask > 0), 0.5 * (bid + ask), np.nan)
+        T = np.array([year_fraction(now, e) for e in expiry])
+        return implied_vol(mid, S, K, T, self.rate, self.dividend_yield, right)
+
+    def Greeks(self, snapshot, rows, now, iv):
+        S, K, T, right = self._inputs(snapshot, rows, now)
+        return greeks(S, K, T, self.rate, self.dividend_yield, iv, right)
+
+#Running comparison of the Black-Scholes solve against the contracts' own (finite-difference) IV and delta
+class PricingReport:
+
+    def __init__(self, pricer):
+        self.pricer = pricer
+        self.iv_errors = []
+        self.delta_errors = []
+
+    def Add(self, snapshot, rows, now):
+        rows = np.asarray(rows, dtype = np.int64)
+        if len(rows) == 0:
+            return
+        iv = self.pricer.ImpliedVol(snapshot, rows, now)
+        delta = self.pricer.Greeks(snapshot, rows, now, iv)["delta"]
+        fd_iv = np.array([float(snapshot.contracts[i].ImpliedVolatility) for i in rows])
+        fd_delta = np.array([float(snapshot.contracts[i].Greeks.Delta) for i in rows])
+        self.iv_errors.extend(np.abs(iv - fd_iv)[np.isfinite(iv)].tolist())
+        self.delta_errors.extend(np.abs(delta - fd_delta)[np.isfinite(delta)].tolist())
+
+    def Summary(self):
+        summary = {"contracts": len(self.iv_errors)}
+        for name, errors in (("iv", self.iv_errors), ("delta", self.delta_errors)):
+            errors = np.array(errors)
+            if len(errors) == 0:
+                continue
+            summary[name + "_mean_abs"] = round(float(errors.mean()), 6)
+            summary[name + "_p95_abs"] = round(float(np.percentile(errors, 95)), 6)
+            summary[name + "_max_abs"] = round(float(errors.max()), 6)
+        return summary
@@ -0,0 +1,87 @@
+import json
+import time
+import bisect
+
+#Per-stage timers, counters and per-bar-type latency histograms for OnData
+#Every entry point returns immediately while disabled, so the instrumentation can stay in the hot path and be
+#switched on for a run (profile_on parameter) or toggled mid-run through `enabled`
+
+#Upper edges of the latency histogram buckets in microseconds, powers of two up to about one second
+BUCKETS = [2 ** i for i in range(21)]
+
+class Profiler:
+
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.Reset()
+
+    def Reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.bars = {}
+
+    #Timestamp to hand back to Stop or Bar, or None while disabled
+    def Start(self):
+        return time.perf_counter() if self.enabled else None
+
+    #Charge the time since `started` to a stage; returns a fresh start so consecutive stages can be chained
+    def Stop(self, stage, started):
+        if started is None:
+            return None
+        now = time.perf_counter()
+        elapsed = now - started
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+        return now
+
+    def Count(self, counter, n = 1):
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    #Record one OnData call of the given bar type in its latency histogram
+    def Bar(self, kind, started):
+        if started is None:
+            return
+        micros = (time.perf_counter() - started) * 1e6
+        histogram = self.bars.get(kind)
+        if histogram is None:
+            histogram = self.bars[kind] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, micros)] += 1
+        histogram[-1] += micros
+
+    #Bucket edge below which the given share of a histogram's calls fall
+    def _percentile(self, counts, share):
+        target = share * sum(counts)
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target and n > 0:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return 0
+
+    def Summary(self):
+        stages = {}
+        for stage, (calls, total, worst) in self.stages.items():
+            stages[stage] = {"calls": calls, "total_ms": round(total * 1e3, 3), "mean_us": round(total * 1e6 / calls, 3), "max_us": round(worst * 1e6, 3)}
+        bars = {}
+        for kind, histogram in self.bars.items():
+            counts, total = histogram[:-1], histogram[-1]
+            calls = sum(counts)
+            bars[kind] = {
+                "calls": calls,
+                "total_ms": round(total / 1e3, 3),
+                "mean_us": round(total / calls, 3) if calls else 0.0,
+                "p50_us": self._percentile(counts, 0.5),
+                "p99_us": self._percentile(counts, 0.99),
+                "histogram_us": {("<=" + str(BUCKETS[i]) if i < len(BUCKETS) else ">" + str(BUCKETS[-1])): n for i, n in enumerate(counts) if n > 0},
+            }
+        return {"stages": stages, "counters": dict(self.counters), "bars": bars}
+
+    def ToJson(self):
+        return json.dumps(self.Summary(), sort_keys = True)
@@ -0,0 +1,116 @@
+from chains import CALL, PUT
+
+#Option structures as declarative leg specs, compiled once into selectors over a ChainIndex
+#A leg is a right, a strike selection (ATM, or the k-th OTM / ITM strike of the target expiry), a ratio and a side; a
+#strategy adds how it is sized, whether it gets a stop-loss trigger and whether it is delta hedged
+
+ATM = "ATM"
+OTM = "OTM"
+ITM = "ITM"
+
+BUY = 1
+SELL = -1
+
+class LegSpec:
+
+    __slots__ = ("right", "moneyness", "tier", "ratio", "side")
+
+    def __init__(self, right, moneyness, tier = 0, ratio = 1, side = BUY):
+        self.right = right
+        self.moneyness = moneyness
+        self.tier = tier
+        self.ratio = ratio
+        self.side = side
+
+    @property
+    def quantity(self):
+        return self.side * self.ratio
+
+#sizing is "order_quantity" (fewest contracts CalculateOrderQuantity gives any leg for a target of `size`),
+#"fixed" (`size` units) or "margin" (share of remaining margin over the combined leg prices, see Quantity)
+class StrategySpec:
+
+    __slots__ = ("name", "legs", "sizing", "size", "stop", "hedge")
+
+    def __init__(self, name, legs, sizing, size = None, stop = False, hedge = False):
+        self.name = name
+        self.legs = tuple(legs)
+        self.sizing = sizing
+        self.size = size
+        self.stop = stop
+        self.hedge = hedge
+
+STRATEGIES = [
+    #Long a Straddle (long at the money call and put)
+    StrategySpec("Straddle", [LegSpec(CALL, ATM), LegSpec(PUT, ATM)], "order_quantity", .025, hedge = True),
+    #Short a Straddle (short at the money call and put)
+    StrategySpec("Short Straddle", [LegSpec(CALL, ATM, side = SELL), LegSpec(PUT, ATM, side = SELL)], "order_quantity", .025, stop = True, hedge = True),
+    #Strangle on the first out of the money call and put, sold one unit at a time
+    StrategySpec("Strangle", [LegSpec(CALL, OTM, 1, side = SELL), LegSpec(PUT, OTM, 1, side = SELL)], "fixed", 1),
+    #Long a Butterfly (buy one ITM and OTM call option and sell two ATM call options)
+    StrategySpec("Butterfly", [LegSpec(CALL, OTM, 5), LegSpec(CALL, ITM, 5), LegSpec(CALL, ATM, ratio = 2, side = SELL)], "fixed", 1),
+    #Long a Condor (buy the lowest and highest strike calls, sell the two calls in between)
+    StrategySpec("Condor", [LegSpec(CALL, OTM, 2), LegSpec(CALL, OTM, 1, side = SELL), LegSpec(CALL, ITM, 2), LegSpec(CALL, ITM, 1, side = SELL)], "margin"),
+    #Iron Butterfly (sell one OTM call, buy one ITM call, buy and sell one ATM call)
+    StrategySpec("Iron Butterfly", [LegSpec(CALL, OTM, 1, side = SELL), LegSpec(CALL, ITM, 1), LegSpec(CALL, ATM), LegSpec(CALL, ATM, side = SELL)], "margin"),
+    #Iron Condor (sell the nearest OTM call and put, buy the next OTM call and put)
+    StrategySpec("Iron Condor", [LegSpec(CALL, OTM, 0, side = SELL), LegSpec(PUT, OTM, 0, side = SELL), LegSpec(CALL, OTM, 1), LegSpec(PUT, OTM, 1)], "margin"),
+]
+
+#A strategy spec bound to ChainIndex lookups
+class CompiledStrategy:
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.name
+        self.selectors = [self._selector(leg) for leg in spec.legs]
+
+    @staticmethod
+    def _selector(leg):
+        if leg.moneyness == ATM:
+            return lambda index: index.AtmRow(leg.right)
+        if leg.moneyness == OTM:
+            return lambda index: index.OtmRow(leg.right, leg.tier)
+        if leg.moneyness == ITM:
+            return lambda index: index.ItmRow(leg.right, leg.tier)
+        raise ValueError("Unknown strike selection " + str(leg.moneyness))
+
+    #Snapshot rows for every leg at the target expiry, or None when the chain is missing one of them
+    def Rows(self, index):
+        rows = []
+        for selector in self.selectors:
+            row = selector(index)
+            if row is None:
+                return None
+            rows.append(row)
+        return rows
+
+    #Units of the structure to trade, from a single sizing calculation
+    def Quantity(self, algorithm, contracts, margin_use_ratio):
+        spec = self.spec
+        if spec.sizing == "fixed":
+            return int(spec.size)
+        if spec.sizing == "order_quantity":
+            return min(algorithm.CalculateOrderQuantity(contract.Symbol, spec.size) for contract in contracts)
+        price = sum(leg.ratio * (contract.AskPrice if leg.side == BUY else contract.BidPrice) for leg, contract in zip(spec.legs, contracts))
+        if not price > 0:
+            return 0
+        return int(algorithm.Portfolio.MarginRemaining * margin_use_ratio / price / 100)
+
+    #Orders for `quantity` units as (symbol, quantity) pairs in leg order, netted per contract; whole contracts, as
+    #Leg.Create takes an int and CalculateOrderQuantity returns a decimal
+    def Orders(self, contracts, quantity):
+        orders = {}
+        symbols = {}
+        for leg, contract in zip(self.spec.legs, contracts):
+            key = str(contract.Symbol)
+            symbols.setdefault(key, contract.Symbol)
+            orders[key] = orders.get(key, 0) + leg.quantity * quantity
+        return [(symbols[key], int(n)) for key, n in orders.items() if int(n) != 0]
+
+    #Net premium of the orders at the prices they would fill at, per share
+    def Premium(self, contracts, quantity):
+        return sum(leg.quantity * quantity * (contract.AskPrice if leg.side == BUY else contract.BidPrice) for leg, contract in zip(self.spec.legs, contracts))
+
+def Compile(specs = STRATEGIES):
+    return {spec.name: CompiledStrategy(spec) for spec in specs}
@@ -0,0 +1,112 @@
+import heapq
+import datetime
+
+#Stop-loss triggers for open positions, indexed by the option legs they watch
+#A position's stop is only evaluated in a minute where one of its legs was quoted, so the per-minute cost follows
+#quote updates on held contracts rather than the size of the universe
+class StopTriggers:
+
+    def __init__(self):
+        self.thresholds = {}
+        self.legs = {}
+        self.symbols = {}
+        self.owners = {}
+
+    def __len__(self):
+        return len(self.thresholds)
+
+    def __contains__(self, ticker):
+        return ticker in self.thresholds
+
+    #Watch the combined ask of the legs and fire once it rises above the threshold
+    def Add(self, ticker, legs, threshold):
+        self.Remove(ticker)
+        self.thresholds[ticker] = threshold
+        self.legs[ticker] = tuple(legs)
+        for leg in legs:
+            self.symbols[str(leg)] = leg
+            self.owners.setdefault(str(leg), []).append(ticker)
+
+    def Remove(self, ticker):
+        self.thresholds.pop(ticker, None)
+        for leg in self.legs.pop(ticker, ()):
+            owners = self.owners[str(leg)]
+            owners.remove(ticker)
+            if not owners:
+                del self.owners[str(leg)]
+                del self.symbols[str(leg)]
+
+    #Tickers with at least one leg in the slice's quote bars, each listed once
+    def Quoted(self, quotes):
+        tickers = []
+        for key, owners in self.owners.items():
+            if quotes.ContainsKey(self.symbols[key]):
+                tickers.extend(ticker for ticker in owners if ticker not in tickers)
+        return tickers
+
+    #Quoted tickers whose combined leg ask is above their stop
+    def Breached(self, quotes, securities):
+        breached = []
+        for ticker in self.Quoted(quotes):
+            value = sum(securities[leg].AskPrice for leg in self.legs[ticker])
+            if value > self.thresholds[ticker]:
+                breached.append(ticker)
+        return breached
+    
+    #Checkpoint as {ticker: [legs, threshold]} with legs as symbol strings; parse turns them back into symbols
+    def State(self):
+        return {ticker: [[str(leg) for leg in self.legs[ticker]], self.thresholds[ticker]] for ticker in self.thresholds}
+    
+    def Restore(self, state, parse):
+        self.__init__()
+        for ticker, (legs, threshold) in state.items():
+            self.Add(ticker, [parse(leg) for leg in legs], threshold)
+
+#Calendar-keyed queue of position expiry dates
+#Entries left behind by positions closed early are dropped lazily when they reach the head of the heap
+class ExpiryQueue:
+
+    def __init__(self):
+        self.heap = []
+        self.dates = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, ticker):
+        return ticker in self.dates
+
+    def Add(self, ticker, date):
+        self.dates[ticker] = date
+        heapq.heappush(self.heap, (date, ticker))
+
+    def Remove(self, ticker):
+        self.dates.pop(ticker, None)
+
+    def _prune(self):
+        while self.heap and self.dates.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    #Earliest pending expiry date, or None
+    def Next(self):
+        self._prune()
+        return self.heap[0][0] if self.heap else None
+
+    #Remove and return the tickers expiring on or before this date
+    def Due(self, date):
+        due = []
+        self._prune()
+        while self.heap and self.heap[0][0] <= date:
+            _, ticker = heapq.heappop(self.heap)
+            del self.dates[ticker]
+            due.append(ticker)
+            self._prune()
+        return due
+    
+    def State(self):
+        return {ticker: date.isoformat() for ticker, date in self.dates.items()}
+    
+    def Restore(self, state):
+        self.__init__()
+        for ticker, date in state.items():
+            self.Add(ticker, datetime.date.fromisoformat(date))
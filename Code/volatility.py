@@ -0,0 +1,149 @@
+import math
+
+#Incremental realized volatility over several lookbacks at once
+#A lookback of N days uses the last N daily closes (N - 1 log returns), matching np.std over History(N, Resolution.Daily)
+class RealizedVolatility:
+
+    def __init__(self, periods, annualization = 252):
+        self.periods = sorted(set(int(p) for p in periods))
+        self.annualization = annualization
+        self.size = max(max(self.periods) - 1, 1)
+        self.returns = [0.0] * self.size
+        self.count = 0
+        self.last_close = None
+        self.sums = {p: 0.0 for p in self.periods}
+        self.sums_sq = {p: 0.0 for p in self.periods}
+
+    def Reset(self):
+        self.returns = [0.0] * self.size
+        self.count = 0
+        self.last_close = None
+        for p in self.periods:
+            self.sums[p] = 0.0
+            self.sums_sq[p] = 0.0
+
+    #Add a new daily close, O(1) per lookback
+    def Update(self, close):
+        close = float(close)
+        if self.last_close is None:
+            self.last_close = close
+            return
+        r = math.log(close) - math.log(self.last_close) #Log difference to approximate percentage
+        self.last_close = close
+        self._push(r)
+    
+    def _push(self, r):
+        slot = self.count % self.size
+        for p in self.periods:
+            n = p - 1
+            if n <= 0:
+                continue
+            if self.count >= n:
+                old = self.returns[(self.count - n) % self.size]
+                self.sums[p] -= old
+                self.sums_sq[p] -= old * old
+            self.sums[p] += r
+            self.sums_sq[p] += r * r
+        self.returns[slot] = r
+        self.count += 1
+
+    #Annualized population standard deviation of log returns for the given lookback
+    def Value(self, period):
+        n = min(self.count, period - 1)
+        if n <= 0:
+            return float("nan")
+        mean = self.sums[period] / n
+        variance = max(self.sums_sq[period] / n - mean * mean, 0.0)
+        return math.sqrt(variance) * math.sqrt(self.annualization)
+
+    #Checkpoint of the return window, oldest first, with the running sums
+    def State(self):
+        n = min(self.count, self.size)
+        returns = [self.returns[i % self.size] for i in range(self.count - n, self.count)]
+        return {"periods": self.periods, "returns": returns, "count": self.count, "last_close": self.last_close,
+                "sums": [self.sums[p] for p in self.periods], "sums_sq": [self.sums_sq[p] for p in self.periods]}
+    
+    #Restore a checkpoint; the sums are copied when the lookbacks match, otherwise rebuilt from the stored returns,
+    #which fails (returns False) when the checkpoint holds fewer returns than this estimator's longest lookback needs
+    def Restore(self, state):
+        returns = state["returns"]
+        if state["periods"] != self.periods and len(returns) < min(state["count"], self.size):
+            return False
+        self.Reset()
+        self.last_close = state["last_close"]
+        if state["periods"] != self.periods:
+            for r in returns[-self.size:]:
+                self._push(r)
+            return True
+        self.count = state["count"]
+        for j, r in enumerate(returns):
+            self.returns[(self.count - len(returns) + j) % self.size] = r
+        for p, total, total_sq in zip(self.periods, state["sums"], state["sums_sq"]):
+            self.sums[p] = total
+            self.sums_sq[p] = total_sq
+        return True
+
+#Streaming z-score of a price against the rolling mean and sample standard deviation of its last daily closes
+#Mean and deviation are refreshed once per close so scoring a live price is one subtraction and one division
+class RollingZScore:
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.values = [0.0] * self.period
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.mean = float("nan")
+        self.std = float("nan")
+
+    def Reset(self):
+        self.values = [0.0] * self.period
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.mean = float("nan")
+        self.std = float("nan")
+
+    def Update(self, close):
+        close = float(close)
+        slot = self.count % self.period
+        if self.count >= self.period:
+            old = self.values[slot]
+            self.sum -= old
+            self.sum_sq -= old * old
+        self.values[slot] = close
+        self.sum += close
+        self.sum_sq += close * close
+        self.count += 1
+        n = min(self.count, self.period)
+        self.mean = self.sum / n
+        if n > 1:
+            variance = max((self.sum_sq - n * self.mean * self.mean) / (n - 1), 0.0)
+            self.std = variance ** .5
+        else:
+            self.std = float("nan")
+
+    @property
+    def IsReady(self):
+        return self.count >= self.period and self.std > 0
+
+    def Score(self, price):
+        return (price - self.mean) / self.std
+    
+    def State(self):
+        n = min(self.count, self.period)
+        values = [self.values[i % self.period] for i in range(self.count - n, self.count)]
+        return {"period": self.period, "values": values, "count": self.count, "sum": self.sum, "sum_sq": self.sum_sq, "mean": self.mean, "std": self.std}
+    
+    #Restore a checkpoint exactly when the period matches, otherwise replay its closes
+    def Restore(self, state):
+        self.Reset()
+        if state["period"] != self.period:
+            for close in state["values"]:
+                self.Update(close)
+            return True
+        self.count = state["count"]
+        for j, close in enumerate(state["values"]):
+            self.values[(self.count - len(state["values"]) + j) % self.period] = close
+        self.sum, self.sum_sq, self.mean, self.std = state["sum"], state["sum_sq"], state["mean"], state["std"]
+        return True
@@ -0,0 +1 @@
+from offline.engine import Engine, Result, QCAlgorithm, load_algorithm
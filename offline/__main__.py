@@ -0,0 +1,60 @@
+import os
+import json
+import time
+import argparse
+
+from offline.engine import Engine
+from offline.chainstore import ChainStore
+
+#Run Code/main.py (or another algorithm file) against local data and write summary, equity curve, orders and log
+def main():
+    parser = argparse.ArgumentParser(prog = "python -m offline", description = "Offline replay of a QCAlgorithm over local minute data")
+    parser.add_argument("--data", required = True, help = "data root with equity/ and option/ folders")
+    parser.add_argument("--algorithm", default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code", "main.py"))
+    parser.add_argument("--store", help = "memory-mapped chain store built with python -m offline.chainstore, used instead of the CSV chain files")
+    parser.add_argument("--out", default = "results")
+    parser.add_argument("--fee-per-contract", type = float, default = 0.0)
+    parser.add_argument("--param", action = "append", default = [], metavar = "NAME=VALUE", help = "algorithm parameter served by GetParameter")
+    parser.add_argument("--mode", choices = ["bar", "event"], default = "bar", help = "bar replays every minute; event wakes OnData only at signal-relevant minutes (needs --store)")
+    parser.add_argument("--parity", action = "store_true", help = "run both modes and check that they place the same orders")
+    parser.add_argument("--echo", action = "store_true", help = "print Log/Debug output as it happens")
+    parser.add_argument("--profile", action = "store_true", help = "switch on the algorithm's profiler and write its summary to profile.json")
+    parser.add_argument("--checkpoint", metavar = "DIR", help = "write checkpoints to this folder when warm-up ends and every --checkpoint-every trading days")
+    parser.add_argument("--checkpoint-every", type = int, default = 0, metavar = "DAYS")
+    parser.add_argument("--resume", metavar = "PATH", help = "resume from a checkpoint file, or the latest one in a folder")
+    parser.add_argument("--journal", action = "store_true", help = "write the algorithm's trade journal to journal.bin / journal.json (read it with python -m offline.journal)")
+    args = parser.parse_args()
+    parameters = dict(p.split("=", 1) for p in args.param)
+    if args.profile:
+        parameters["profile_on"] = "true"
+    if args.journal and not args.parity:
+        parameters["journal_path"] = os.path.join(args.out, "journal")
+    if (args.mode == "event" or args.parity) and not args.store:
+        parser.error("--mode event and --parity need a chain store (--store)")
+    option_source = ChainStore(args.store) if args.store else None
+    if args.parity:
+        runs = {}
+        for mode in ("bar", "event"):
+            started = time.time()
+            engine = Engine(args.algorithm, args.data, parameters = parameters, option_source = option_source, fee_per_contract = args.fee_per_contract, mode = mode, resume = args.resume)
+            runs[mode] = (engine.Run(), time.time() - started)
+            print("{}: {:.1f}s, {} orders".format(mode, runs[mode][1], len(runs[mode][0].orders)))
+        key = lambda o: (o["time"], o["symbol"], o["quantity"], round(o["price"], 6))
+        same = [key(o) for o in runs["bar"][0].orders] == [key(o) for o in runs["event"][0].orders]
+        print("parity: " + ("orders match" if same else "ORDERS DIFFER"))
+        raise SystemExit(0 if same else 1)
+    engine = Engine(args.algorithm, args.data, parameters = parameters, option_source = option_source, fee_per_contract = args.fee_per_contract, echo = args.echo, mode = args.mode,
+                    checkpoint = args.checkpoint, checkpoint_every = args.checkpoint_every, resume = args.resume)
+    result = engine.Run()
+    result.Save(args.out)
+    print(json.dumps(result.Summary(), indent = 2))
+    profiler = getattr(engine.algorithm, "profiler", None)
+    if args.profile and profiler is not None:
+        with open(os.path.join(args.out, "profile.json"), "w") as f:
+            json.dump(profiler.Summary(), f, indent = 2, sort_keys = True)
+        print("Profile written to " + os.path.join(args.out, "profile.json"))
+    if args.mode == "event":
+        print("OnData called on {} bars, skipped {}".format(engine.event_bars, engine.skipped_bars))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import subprocess
+import tracemalloc
+
+from offline.engine import Engine
+from offline.chainstore import ChainStore
+from offline import synthetic
+
+#Reproducible OnData benchmarks over synthetic markets
+#Each scenario is replayed once for throughput and once under tracemalloc for memory; results are appended to a
+#JSONL file together with the commit so runs can be compared over time
+
+SCENARIOS = {
+    "strikes15": {"underlyings": 1, "strikes": 15, "expiries": 3, "days": 10},
+    "strikes100": {"underlyings": 1, "strikes": 100, "expiries": 3, "days": 10},
+    "expiries8": {"underlyings": 1, "strikes": 15, "expiries": 8, "days": 10},
+    "underlyings50": {"underlyings": 50, "strikes": 15, "expiries": 3, "days": 3, "quote_every": 5},
+}
+
+METRICS = ["bars_per_sec", "peak_kb", "allocated_blocks"]
+
+def _commit():
+    try:
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = folder, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#Minutes OnData was called with after warm-up; throughput is measured over that part of the run only
+def _bars(engine):
+    if engine.mode == "event":
+        return engine.event_bars
+    clock = next(iter(engine.equity_bars.values()))
+    return sum(int(clock.day_ends[i] - clock.day_starts[i]) for i, d in enumerate(clock.dates) if engine.start <= d <= engine.end)
+
+def _engine(algorithm, folder, store, bars, parameters, mode):
+    return Engine(algorithm, folder, parameters = parameters, option_source = ChainStore(store), equity_bars = bars, mode = mode)
+
+def measure(name, config, algorithm, work, mode = "bar", memory = True, parameters = None):
+    folder = os.path.join(work, name)
+    os.makedirs(folder, exist_ok = True)
+    bars, store, tickers = synthetic.prepare(config, folder)
+    parameters = dict({"stock_list": ",".join(tickers)}, **(parameters or {}))
+    gc.collect()
+    engine = _engine(algorithm, folder, store, bars, parameters, mode)
+    started = time.perf_counter()
+    result = engine.Run()
+    seconds = time.perf_counter() - started
+    trading = seconds - engine.warmup_seconds
+    replayed = _bars(engine)
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "scenario": name,
+        "config": dict(synthetic.DEFAULTS, **config),
+        "mode": mode,
+        "parameters": parameters if len(tickers) < 5 else dict(parameters, stock_list = "{} tickers".format(len(tickers))),
+        "bars": replayed,
+        "seconds": round(seconds, 3),
+        "warmup_seconds": round(engine.warmup_seconds, 3),
+        "bars_per_sec": round(replayed / trading, 1) if trading > 0 else None,
+        "orders": len(result.orders),
+    }
+    if memory:
+        engine = result = None
+        gc.collect()
+        engine = _engine(algorithm, folder, store, bars, parameters, mode)
+        collections = sum(stat["collections"] for stat in gc.get_stats())
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        engine.Run()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record["peak_kb"] = round(peak / 1024.0, 1)
+        record["retained_kb"] = round(current / 1024.0, 1)
+        record["allocated_blocks"] = sys.getallocatedblocks() - blocks
+        record["gc_collections"] = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    return record
+
+def load(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append(records, path):
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys = True) + "\n")
+
+#Latest earlier record with the same scenario, configuration and mode
+def previous(history, record):
+    for old in reversed(history):
+        if old["scenario"] == record["scenario"] and old["config"] == record["config"] and old["mode"] == record["mode"]:
+            return old
+    return None
+
+def report(record, before = None):
+    line = "{:<14} {:>9} bars {:>8.2f}s {:>10} bars/s".format(record["scenario"], record["bars"], record["seconds"], record["bars_per_sec"])
+    if "peak_kb" in record:
+        line += " {:>10.0f} KB peak {:>9} blocks".format(record["peak_kb"], record["allocated_blocks"])
+    if before is not None:
+        changes = []
+        for name in METRICS:
+            if record.get(name) and before.get(name):
+                changes.append("{} {:+.1%}".format(name, record[name] / before[name] - 1))
+        line += "  vs {}: {}".format(before.get("commit"), ", ".join(changes))
+    print(line)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m offline.bench", description = "Benchmark OnData over synthetic option chains")
+    parser.add_argument("--algorithm", default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code", "main.py"))
+    parser.add_argument("--scenario", action = "append", choices = sorted(SCENARIOS), help = "scenarios to run (default: all)")
+    parser.add_argument("--custom", action = "append", default = [], metavar = "NAME=VALUE", help = "override a generator setting for every scenario, e.g. days=10")
+    parser.add_argument("--param", action = "append", default = [], metavar = "NAME=VALUE", help = "algorithm parameter served by GetParameter")
+    parser.add_argument("--mode", choices = ["bar", "event"], default = "bar")
+    parser.add_argument("--work", default = os.path.join("results", "bench-data"), help = "folder caching the generated chain stores")
+    parser.add_argument("--out", default = os.path.join("results", "bench.jsonl"))
+    parser.add_argument("--no-memory", action = "store_true", help = "skip the tracemalloc pass")
+    args = parser.parse_args(argv)
+    overrides = {}
+    for text in args.custom:
+        name, value = text.split("=", 1)
+        overrides[name] = value if name == "start" else int(value)
+    parameters = dict(p.split("=", 1) for p in args.param)
+    history = load(args.out)
+    records = []
+    for name in args.scenario or sorted(SCENARIOS):
+        record = measure(name, dict(SCENARIOS[name], **overrides), args.algorithm, args.work, args.mode, not args.no_memory, parameters)
+        report(record, previous(history, record))
+        records.append(record)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok = True)
+    append(records, args.out)
+    print("{} results appended to {}".format(len(records), args.out))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
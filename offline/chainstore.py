@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import numpy as np
+
+from offline.data import CsvOptionSource, contract_key
+
+#On-disk columnar store for minute option chain history, one raw memory-mapped file per field
+#Rows are sorted by (date, minute, expiry, right, strike) so every timestamp is one contiguous row range
+#Index files map day -> timestamps -> rows; all reads are zero-copy slices of read-only maps shared through the page cache
+
+FIELDS = {
+    "minute": np.int16,
+    "expiry": np.int32,
+    "strike": np.float32,
+    "right": np.int8,
+    "bid": np.float64,
+    "ask": np.float64,
+    "iv": np.float32,
+    "delta": np.float32,
+    "gamma": np.float32,
+    "vega": np.float32,
+    "theta": np.float32,
+}
+
+INDEX = {
+    "day_ordinal": np.int32,
+    "day_row_offsets": np.int64,
+    "day_stamp_offsets": np.int64,
+    "stamp_minute": np.int16,
+    "stamp_row_offsets": np.int64,
+}
+
+#Append-only writer for one underlying
+class ChainStoreWriter:
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok = True)
+        self.files = {name: open(os.path.join(folder, name + ".bin"), "wb") for name in FIELDS}
+        self.rows = 0
+        self.index = {name: [] for name in INDEX}
+        for name in ("day_row_offsets", "day_stamp_offsets", "stamp_row_offsets"):
+            self.index[name].append(0)
+
+    #Append one trading day; columns are arrays keyed like FIELDS, in any row order
+    def AddDay(self, date, columns):
+        order = np.lexsort((columns["strike"], columns["right"], columns["expiry"], columns["minute"]))
+        data = {name: np.ascontiguousarray(np.asarray(columns[name])[order], dtype = dtype) for name, dtype in FIELDS.items()}
+        n = len(order)
+        for name in FIELDS:
+            data[name].tofile(self.files[name])
+        minute = data["minute"].astype(np.int64)
+        stamp_starts = np.flatnonzero(np.r_[True, minute[1:] != minute[:-1]]) if n > 0 else np.empty(0, dtype = np.int64)
+        self.index["stamp_minute"].extend(minute[stamp_starts].tolist())
+        self.index["stamp_row_offsets"].extend((self.rows + np.r_[stamp_starts[1:], n]).tolist())
+        self.rows += n
+        self.index["day_ordinal"].append(date.toordinal())
+        self.index["day_row_offsets"].append(self.rows)
+        self.index["day_stamp_offsets"].append(len(self.index["stamp_minute"]))
+
+    def Close(self):
+        for f in self.files.values():
+            f.close()
+        for name, dtype in INDEX.items():
+            np.asarray(self.index[name], dtype = dtype).tofile(os.path.join(self.folder, name + ".bin"))
+        meta = {"rows": self.rows, "days": len(self.index["day_ordinal"]), "fields": {name: np.dtype(t).str for name, t in FIELDS.items()}}
+        with open(os.path.join(self.folder, "meta.json"), "w") as f:
+            json.dump(meta, f, indent = 2)
+
+def _map(folder, name, dtype):
+    path = os.path.join(folder, name + ".bin")
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = "r")
+
+#One trading day of an underlying; exposes the same members as data.OptionDay over memory-mapped slices
+class StoreDay:
+
+    def __init__(self, store, i):
+        self.store = store
+        self.row_start = int(store.day_row_offsets[i])
+        self.row_end = int(store.day_row_offsets[i + 1])
+        self.stamp_start = int(store.day_stamp_offsets[i])
+        self.stamp_end = int(store.day_stamp_offsets[i + 1])
+        self.stamp_minute = store.stamp_minute[self.stamp_start:self.stamp_end]
+        for name in FIELDS:
+            setattr(self, name, store.columns[name][self.row_start:self.row_end])
+        self.by_contract = None
+
+    def __len__(self):
+        return self.row_end - self.row_start
+
+    def _stamp(self, minute):
+        i = int(np.searchsorted(self.stamp_minute, minute, side = "left"))
+        if i < len(self.stamp_minute) and self.stamp_minute[i] == minute:
+            return self.stamp_start + i
+        return None
+
+    def Key(self, row):
+        return int(contract_key(self.expiry[row], self.right[row], self.strike[row]))
+
+    #Rows (day-relative) quoted at exactly this minute
+    def Block(self, minute):
+        s = self._stamp(minute)
+        if s is None:
+            return 0, 0
+        return int(self.store.stamp_row_offsets[s]) - self.row_start, int(self.store.stamp_row_offsets[s + 1]) - self.row_start
+
+    #Row of the last quote for a contract at or before this minute, or None; like data.OptionDay.QuoteRow, through a
+    #contract-sorted index built on the first lookup of the day (rows are already in minute order)
+    def QuoteRow(self, key, minute):
+        if self.by_contract is None:
+            keys = contract_key(self.expiry, self.right, self.strike.astype(np.float64))
+            self.by_contract = np.argsort(keys, kind = "stable")
+            self.sorted_key = keys[self.by_contract]
+        start = np.searchsorted(self.sorted_key, key, side = "left")
+        end = np.searchsorted(self.sorted_key, key, side = "right")
+        if start == end:
+            return None
+        rows = self.by_contract[start:end]
+        i = np.searchsorted(self.minute[rows], minute, side = "right") - 1
+        if i < 0:
+            return None
+        return int(rows[i])
+
+class ChainStoreTicker:
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.columns = {name: _map(folder, name, dtype) for name, dtype in FIELDS.items()}
+        for name, dtype in INDEX.items():
+            setattr(self, name, _map(folder, name, dtype))
+        self.day_lookup = {int(d): i for i, d in enumerate(self.day_ordinal)}
+
+    def Day(self, date):
+        i = self.day_lookup.get(date.toordinal())
+        return None if i is None else StoreDay(self, i)
+
+#Option source backed by one store folder per underlying; drop-in for data.CsvOptionSource
+class ChainStore:
+
+    def __init__(self, root):
+        self.root = root
+        self.tickers = {}
+
+    def Tickers(self):
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, "meta.json")))
+
+    def Ticker(self, ticker):
+        key = ticker.lower()
+        if key not in self.tickers:
+            folder = os.path.join(self.root, key)
+            self.tickers[key] = ChainStoreTicker(folder) if os.path.exists(os.path.join(folder, "meta.json")) else None
+        return self.tickers[key]
+
+    def Day(self, ticker, date):
+        data = self.Ticker(ticker)
+        return None if data is None else data.Day(date)
+
+#Convert the per-day CSV chain files of a data folder into a store
+def build(data_root, store_root, tickers = None):
+    source = CsvOptionSource(data_root)
+    for ticker in tickers or source.Tickers():
+        folder = os.path.join(data_root, "option", ticker.lower())
+        dates = sorted(datetime.date.fromisoformat(name[:-4]) for name in os.listdir(folder) if name.endswith(".csv"))
+        writer = ChainStoreWriter(os.path.join(store_root, ticker.lower()))
+        for date in dates:
+            day = source.Day(ticker, date)
+            if day is not None:
+                writer.AddDay(date, {name: getattr(day, name) for name in FIELDS})
+        writer.Close()
+        print("{}: {} days, {} rows".format(ticker, len(dates), writer.rows))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m offline.chainstore", description = "Build a memory-mapped option chain store from CSV chain files")
+    parser.add_argument("--data", required = True, help = "data root with option/<ticker>/<date>.csv files")
+    parser.add_argument("--out", required = True, help = "store folder to write")
+    parser.add_argument("--ticker", action = "append", help = "limit to these underlyings")
+    args = parser.parse_args(argv)
+    build(args.data, args.out, args.ticker)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
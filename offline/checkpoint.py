@@ -0,0 +1,70 @@
+import os
+import json
+
+#Run checkpoints: one JSON file per checkpoint holding the engine's portfolio, fills, equity curve and log plus the
+#algorithm's CaptureState, taken after the last completed trading day it names
+#<date>-warmup.json is written when warm-up ends and <date>.json every N trading days after that; files sort by date
+#Fills, equity points and log lines are append-only, so a checkpoint only holds the ones added since the checkpoint it
+#names as "previous" (a path relative to its own folder); read follows that chain back and joins them, which keeps the
+#total checkpoint I/O linear in the length of the run
+
+VERSION = 2
+
+RECORDS = ("orders", "equity", "logs")
+
+def write(folder, state):
+    os.makedirs(folder, exist_ok = True)
+    path = os.path.join(folder, state["date"] + ("-warmup" if state["warmup"] else "") + ".json")
+    if state.get("previous") is not None:
+        state = dict(state, previous = os.path.relpath(os.path.abspath(state["previous"]), os.path.abspath(folder)))
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+    return path
+
+#Checkpoints in a folder by date (only warm-up checkpoints with warmup = True)
+def listing(folder, warmup = False):
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, n) for n in sorted(os.listdir(folder)) if n.endswith(".json") and (not warmup or n.endswith("-warmup.json"))]
+
+#Latest checkpoint in a folder, or None
+def latest(folder, warmup = False):
+    paths = listing(folder, warmup)
+    return paths[-1] if paths else None
+
+#Whether a checkpoint was written by a run over the same data, chain source and parameters
+def matches(path, data, source, parameters):
+    try:
+        state = _load(path)
+    except ValueError:
+        return False
+    return state["data"] == os.path.abspath(data) and state["source"] == os.path.abspath(source) and state["parameters"] == parameters
+
+def _load(path):
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("version") != VERSION:
+        raise ValueError("Unsupported checkpoint version in " + path)
+    return state
+
+#Read a checkpoint file, or the latest one when given a folder, with the records of every earlier checkpoint in its
+#chain joined in; "path" is set to the file that was read
+def read(path):
+    if os.path.isdir(path):
+        found = latest(path)
+        if found is None:
+            raise ValueError("No checkpoint found in " + path)
+        path = found
+    state = _load(path)
+    chain = [state]
+    current = path
+    while chain[-1].get("previous") is not None:
+        current = os.path.join(os.path.dirname(os.path.abspath(current)), chain[-1]["previous"])
+        if not os.path.exists(current):
+            raise ValueError("Checkpoint " + path + " needs the earlier checkpoint " + current)
+        chain.append(_load(current))
+    for name in RECORDS:
+        state[name] = [record for part in reversed(chain) for record in part[name]]
+    state["path"] = path
+    return state
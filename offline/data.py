@@ -0,0 +1,128 @@
+import os
+import csv
+import datetime
+import numpy as np
+
+#Local data layout read by the offline engine
+#  <root>/equity/<ticker>.csv               time,open,high,low,close,volume   (minute bars, time = bar end)
+#  <root>/option/<ticker>/<YYYY-MM-DD>.csv  time,expiry,strike,right,bid,ask,iv,delta[,gamma,vega,theta]
+#Times are "YYYY-MM-DD HH:MM" exchange time, expiry is "YYYY-MM-DD", right is C/P or 0/1
+
+OPTION_FIELDS = ["minute", "expiry", "strike", "right", "bid", "ask", "iv", "delta", "gamma", "vega", "theta"]
+
+def contract_key(expiry, right, strike):
+    return (np.asarray(expiry, dtype = np.int64) * 2 + np.asarray(right, dtype = np.int64)) * 100000000 + np.round(np.asarray(strike) * 1000).astype(np.int64)
+
+def parse_right(value):
+    value = value.strip().upper()
+    return 1 if value in ("P", "1", "PUT") else 0
+
+class EquityBars:
+
+    def __init__(self, ticker, times, open, high, low, close, volume):
+        self.ticker = ticker
+        self.times = times
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        days = times.astype("datetime64[D]")
+        self.day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(times) > 0 else np.empty(0, dtype = np.int64)
+        self.day_ends = np.r_[self.day_starts[1:], len(times)]
+        self.dates = [d.astype(datetime.date) for d in days[self.day_starts]]
+        self.day_lookup = {d: i for i, d in enumerate(self.dates)}
+
+    @staticmethod
+    def Load(path, ticker):
+        times, o, h, l, c, v = [], [], [], [], [], []
+        with open(path, newline = "") as f:
+            for row in csv.DictReader(f):
+                times.append(row["time"])
+                o.append(float(row["open"]))
+                h.append(float(row["high"]))
+                l.append(float(row["low"]))
+                c.append(float(row["close"]))
+                v.append(float(row["volume"]))
+        times = np.array(times, dtype = "datetime64[m]")
+        order = np.argsort(times, kind = "stable")
+        return EquityBars(ticker, times[order], np.array(o)[order], np.array(h)[order], np.array(l)[order], np.array(c)[order], np.array(v)[order])
+
+    #Daily OHLCV aggregated from the minute bars of one trading day
+    def DailyBar(self, day_index):
+        start, end = self.day_starts[day_index], self.day_ends[day_index]
+        return (self.open[start], self.high[start:end].max(), self.low[start:end].min(), self.close[end - 1], self.volume[start:end].sum())
+
+#All option quotes for one underlying on one trading day, sorted by minute
+class OptionDay:
+
+    def __init__(self, columns):
+        order = np.argsort(columns["minute"], kind = "stable")
+        for name in OPTION_FIELDS:
+            setattr(self, name, np.asarray(columns[name])[order])
+        self.key = contract_key(self.expiry, self.right, self.strike)
+        self.by_contract = np.lexsort((self.minute, self.key))
+        self.sorted_key = self.key[self.by_contract]
+
+    def __len__(self):
+        return len(self.minute)
+
+    def Key(self, row):
+        return int(self.key[row])
+
+    #Rows quoted at exactly this minute of the day
+    def Block(self, minute):
+        return int(np.searchsorted(self.minute, minute, side = "left")), int(np.searchsorted(self.minute, minute, side = "right"))
+
+    #Row of the last quote for a contract at or before this minute, or None
+    def QuoteRow(self, key, minute):
+        start = np.searchsorted(self.sorted_key, key, side = "left")
+        end = np.searchsorted(self.sorted_key, key, side = "right")
+        if start == end:
+            return None
+        rows = self.by_contract[start:end]
+        i = np.searchsorted(self.minute[rows], minute, side = "right") - 1
+        if i < 0:
+            return None
+        return int(rows[i])
+
+class CsvOptionSource:
+
+    def __init__(self, root):
+        self.root = root
+
+    def Tickers(self):
+        path = os.path.join(self.root, "option")
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def Day(self, ticker, date):
+        path = os.path.join(self.root, "option", ticker.lower(), date.isoformat() + ".csv")
+        if not os.path.exists(path):
+            return None
+        columns = {name: [] for name in OPTION_FIELDS}
+        with open(path, newline = "") as f:
+            for row in csv.DictReader(f):
+                t = datetime.datetime.fromisoformat(row["time"])
+                columns["minute"].append(t.hour * 60 + t.minute)
+                columns["expiry"].append(datetime.date.fromisoformat(row["expiry"][:10]).toordinal())
+                columns["strike"].append(float(row["strike"]))
+                columns["right"].append(parse_right(row["right"]))
+                for name in ("bid", "ask", "iv", "delta", "gamma", "vega", "theta"):
+                    value = row.get(name)
+                    columns[name].append(float(value) if value not in (None, "") else np.nan)
+        if len(columns["minute"]) == 0:
+            return None
+        types = {"minute": np.int32, "expiry": np.int64, "right": np.int8}
+        return OptionDay({name: np.array(columns[name], dtype = types.get(name, np.float64)) for name in OPTION_FIELDS})
+
+def equity_tickers(root):
+    path = os.path.join(root, "equity")
+    return sorted(name[:-4].upper() for name in os.listdir(path) if name.endswith(".csv")) if os.path.isdir(path) else []
+
+def load_equities(root, tickers):
+    bars = {}
+    for ticker in tickers:
+        path = os.path.join(root, "equity", ticker.lower() + ".csv")
+        if os.path.exists(path):
+            bars[ticker] = EquityBars.Load(path, ticker)
+    return bars
@@ -0,0 +1,893 @@
+import os
+import sys
+import json
+import math
+import time as timer
+import datetime
+import importlib.util
+import numpy as np
+
+from offline import qc, checkpoint
+from offline.qc import Resolution, SecurityType, OptionRight, OrderStatus, Symbol, SymbolRepresentation, TradeBar, QuoteBar, Greeks, OptionContract, OptionChain, KeyValuePair, OrderEvent, OrderTicket, DataDict
+from offline.data import CsvOptionSource, load_equities, contract_key
+from offline.timeline import SignalTimeline
+
+OPTION_MULTIPLIER = 100
+
+#Event-driven replay of local minute data through an unmodified QCAlgorithm subclass
+#Fill model: options buy at the ask and sell at the bid, equities trade at the last close, all fills are immediate
+#Margin model: equities 50%, long options pay the premium, short options premium + max(20% underlying - OTM amount, 10%)
+#Options still held at the close of their expiry date are cash-settled at intrinsic value
+#mode "bar" calls OnData on every minute bar; mode "event" precomputes the HV-IV signal timeline and calls it only at
+#minutes that can change the strategy's state (see offline.timeline); keep "bar" for parity checks
+#With a checkpoint folder the engine saves its own and the algorithm's state (CaptureState) when warm-up ends and every
+#checkpoint_every trading days; resume restores one (RestoreState) and replays only the days after it
+
+class Security:
+
+    def __init__(self, engine, symbol):
+        self.engine = engine
+        self.Symbol = symbol
+        self.Type = symbol.SecurityType
+        self.PriceModel = None
+        self.last_bid = 0.0
+        self.last_ask = 0.0
+
+    def _quote(self):
+        if self.Type == SecurityType.Option:
+            return self.engine.OptionQuote(self)
+        price = self.engine.EquityPrice(self.Symbol.Value)
+        return price, price
+
+    @property
+    def BidPrice(self):
+        return self._quote()[0]
+
+    @property
+    def AskPrice(self):
+        return self._quote()[1]
+
+    @property
+    def Price(self):
+        bid, ask = self._quote()
+        if bid > 0 and ask > 0:
+            return (bid + ask) / 2
+        return max(bid, ask)
+
+    @property
+    def Close(self):
+        return self.Price
+
+    @property
+    def Holdings(self):
+        return self.engine.portfolio[self.Symbol]
+
+    @property
+    def Multiplier(self):
+        return OPTION_MULTIPLIER if self.Type == SecurityType.Option else 1
+
+#Filtered view of one minute of a chain, handed to SetFilter selection functions; mirrors LEAN's OptionFilterUniverse
+#as a row mask so contracts are only materialized for rows that survive the filter
+class OptionFilterUniverse:
+
+    def __init__(self, engine, underlying, day, start, end, date, underlying_price):
+        self.engine = engine
+        self.underlying = underlying
+        self.day = day
+        self.start = start
+        self.end = end
+        self.date = date
+        self.underlying_price = underlying_price
+        self.mask = np.ones(end - start, dtype = bool)
+
+    #Strikes by rank around the one nearest the underlying price, over the contracts still selected
+    def Strikes(self, min_strike, max_strike):
+        strike = self.day.strike[self.start:self.end]
+        strikes = np.unique(strike[self.mask])
+        if len(strikes) == 0:
+            return self
+        atm = int(np.abs(strikes - self.underlying_price).argmin())
+        low = strikes[max(atm + min_strike, 0)]
+        high = strikes[min(atm + max_strike, len(strikes) - 1)]
+        self.mask &= (strike >= low) & (strike <= high)
+        return self
+
+    #Expiries between min_expiry and max_expiry out, as timedeltas or whole days
+    def Expiration(self, min_expiry, max_expiry):
+        if not isinstance(min_expiry, datetime.timedelta):
+            min_expiry = datetime.timedelta(days = min_expiry)
+        if not isinstance(max_expiry, datetime.timedelta):
+            max_expiry = datetime.timedelta(days = max_expiry)
+        expiry = self.day.expiry[self.start:self.end]
+        self.mask &= (expiry >= (self.date + min_expiry).toordinal()) & (expiry <= (self.date + max_expiry).toordinal())
+        return self
+
+    def _month(self, rank):
+        expiry = self.day.expiry[self.start:self.end]
+        expiries = np.unique(expiry[self.mask])
+        if len(expiries) <= rank:
+            self.mask[:] = False
+        else:
+            self.mask &= expiry == expiries[rank]
+        return self
+
+    def FrontMonth(self):
+        return self._month(0)
+
+    def BackMonth(self):
+        return self._month(1)
+
+    def CallsOnly(self):
+        self.mask &= self.day.right[self.start:self.end] == OptionRight.Call
+        return self
+
+    def PutsOnly(self):
+        self.mask &= self.day.right[self.start:self.end] == OptionRight.Put
+        return self
+
+    #Keep the symbols a function picks out of the ones still selected
+    def Contracts(self, selector):
+        day = self.day
+        rows = np.flatnonzero(self.mask)
+        expiry, right, strike = day.expiry[rows + self.start], day.right[rows + self.start], day.strike[rows + self.start]
+        keys = contract_key(expiry, right, strike).tolist()
+        symbols = [self.engine.OptionSymbol(self.underlying, keys[k], expiry[k], right[k], strike[k]) for k in range(len(rows))]
+        keep = set(str(symbol) for symbol in selector(symbols))
+        self.mask[rows] = [str(symbol) in keep for symbol in symbols]
+        return self
+
+#Option subscription returned by AddOption; SetFilter keeps strikes by rank around ATM and expiries by days out, or
+#takes a selection function over an OptionFilterUniverse
+class OptionSubscription(Security):
+
+    def __init__(self, engine, underlying):
+        Security.__init__(self, engine, Symbol("?" + underlying, SecurityType.Option, underlying))
+        self.underlying = underlying
+        self.selector = None
+        self.min_strike = -15
+        self.max_strike = 15
+        self.min_expiry = datetime.timedelta(days = 0)
+        self.max_expiry = datetime.timedelta(days = 35)
+
+    def SetFilter(self, *args):
+        if len(args) == 1 and callable(args[0]):
+            self.selector = args[0]
+            return
+        self.selector = None
+        self.min_strike, self.max_strike, self.min_expiry, self.max_expiry = args
+
+    #Row mask of the filtered universe at one minute
+    def FilterRows(self, day, start, end, date, underlying_price):
+        universe = OptionFilterUniverse(self.engine, self.underlying, day, start, end, date, underlying_price)
+        if self.selector is not None:
+            return self.selector(universe).mask
+        return universe.Expiration(self.min_expiry, self.max_expiry).Strikes(self.min_strike, self.max_strike).mask
+
+class SecurityHolding:
+
+    def __init__(self, engine, symbol):
+        self.engine = engine
+        self.Symbol = symbol
+        self.Quantity = 0
+        self.AveragePrice = 0.0
+
+    @property
+    def Invested(self):
+        return self.Quantity != 0
+
+    @property
+    def AbsoluteQuantity(self):
+        return abs(self.Quantity)
+
+    @property
+    def IsLong(self):
+        return self.Quantity > 0
+
+    @property
+    def IsShort(self):
+        return self.Quantity < 0
+
+    @property
+    def Price(self):
+        return self.engine.Securities[self.Symbol].Price
+
+    @property
+    def HoldingsValue(self):
+        return self.Quantity * self.Price * self.engine.Securities[self.Symbol].Multiplier
+
+    @property
+    def UnrealizedProfit(self):
+        return self.Quantity * (self.Price - self.AveragePrice) * self.engine.Securities[self.Symbol].Multiplier
+
+class Portfolio:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.holdings = {}
+        self.Cash = 0.0
+
+    def __getitem__(self, symbol):
+        key = str(symbol)
+        if key not in self.holdings:
+            self.holdings[key] = SecurityHolding(self.engine, self.engine.Securities[symbol].Symbol)
+        return self.holdings[key]
+
+    def __contains__(self, symbol):
+        return str(symbol) in self.holdings
+
+    def ContainsKey(self, symbol):
+        return str(symbol) in self.holdings
+
+    def Values(self):
+        return list(self.holdings.values())
+
+    @property
+    def TotalHoldingsValue(self):
+        return sum(h.HoldingsValue for h in self.holdings.values() if h.Invested)
+
+    @property
+    def TotalPortfolioValue(self):
+        return self.Cash + self.TotalHoldingsValue
+
+    @property
+    def TotalMarginUsed(self):
+        return sum(self.engine.MarginRequirement(h.Symbol, h.Quantity) for h in self.holdings.values() if h.Invested)
+
+    @property
+    def MarginRemaining(self):
+        return self.TotalPortfolioValue - self.TotalMarginUsed
+
+    @property
+    def Invested(self):
+        return any(h.Invested for h in self.holdings.values())
+
+class Securities:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.securities = {}
+
+    def __getitem__(self, symbol):
+        key = str(symbol)
+        if key not in self.securities:
+            if isinstance(symbol, Symbol) and symbol.SecurityType == SecurityType.Option:
+                self.securities[key] = Security(self.engine, symbol)
+            else:
+                raise KeyError("Security not subscribed: " + key)
+        return self.securities[key]
+
+    def __contains__(self, symbol):
+        return str(symbol) in self.securities
+
+    def ContainsKey(self, symbol):
+        return str(symbol) in self.securities
+
+    def Add(self, security):
+        self.securities[str(security.Symbol)] = security
+        return security
+
+    def Values(self):
+        return list(self.securities.values())
+
+class Slice:
+
+    def __init__(self, engine, time):
+        self.engine = engine
+        self.Time = time
+        self._bars = None
+        self._chains = None
+        self._quotes = None
+
+    @property
+    def Bars(self):
+        if self._bars is None:
+            self._bars = self.engine.CurrentBars()
+        return self._bars
+
+    @property
+    def OptionChains(self):
+        if self._chains is None:
+            self._chains = self.engine.CurrentChains()
+        return self._chains
+
+    @property
+    def QuoteBars(self):
+        if self._quotes is None:
+            self._quotes = self.engine.CurrentQuotes()
+        return self._quotes
+
+    def ContainsKey(self, symbol):
+        return self.Bars.ContainsKey(str(symbol))
+
+    def __getitem__(self, symbol):
+        return self.Bars[str(symbol)]
+
+#Base class standing in for QCAlgorithm; every call is forwarded to the owning engine
+class QCAlgorithm:
+
+    _engine = None
+
+    @property
+    def Time(self):
+        return self._engine.time
+
+    @property
+    def IsWarmingUp(self):
+        return self._engine.warming_up
+
+    @property
+    def Portfolio(self):
+        return self._engine.portfolio
+
+    @property
+    def Securities(self):
+        return self._engine.Securities
+
+    @property
+    def StartDate(self):
+        return self._engine.start
+
+    @property
+    def EndDate(self):
+        return self._engine.end
+
+    def SetStartDate(self, year, month, day):
+        self._engine.start = datetime.date(year, month, day)
+
+    def SetEndDate(self, year, month, day):
+        self._engine.end = datetime.date(year, month, day)
+
+    def SetCash(self, cash):
+        self._engine.portfolio.Cash = float(cash)
+        self._engine.initial_cash = float(cash)
+
+    def SetWarmUp(self, period, resolution = None):
+        if isinstance(period, datetime.timedelta):
+            self._engine.warmup = period
+        else:
+            self._engine.warmup = datetime.timedelta(days = math.ceil(period / 390.0) if resolution != Resolution.Daily else period)
+
+    def SetBenchmark(self, *args):
+        pass
+
+    def SetBrokerageModel(self, *args):
+        pass
+
+    def GetParameter(self, name):
+        value = self._engine.parameters.get(name)
+        return None if value is None else str(value)
+
+    def AddEquity(self, ticker, resolution = Resolution.Minute, *args):
+        return self._engine.AddEquity(ticker)
+
+    def AddOption(self, ticker, resolution = Resolution.Minute, *args):
+        return self._engine.AddOption(ticker)
+
+    def Consolidate(self, symbol, period, handler):
+        if period != Resolution.Daily:
+            raise NotImplementedError("Offline engine only consolidates daily bars")
+        self._engine.consolidators.append((str(symbol), handler))
+
+    def History(self, *args):
+        return self._engine.History(*args)
+
+    def MarketOrder(self, symbol, quantity, asynchronous = False, tag = "", *args, **kwargs):
+        return self._engine.MarketOrder(symbol, quantity, tag)
+
+    def ComboMarketOrder(self, legs, quantity, asynchronous = False, tag = "", *args, **kwargs):
+        return self._engine.ComboMarketOrder(legs, quantity, tag)
+
+    def Liquidate(self, symbol = None, *args):
+        return self._engine.Liquidate(symbol)
+
+    def CalculateOrderQuantity(self, symbol, target):
+        return self._engine.CalculateOrderQuantity(symbol, target)
+
+    def Log(self, message):
+        self._engine.Write("LOG", message)
+
+    def Debug(self, message):
+        self._engine.Write("DEBUG", message)
+
+    def Error(self, message):
+        self._engine.Write("ERROR", message)
+
+#Load an algorithm file the way the LEAN Python runtime does: QuantConnect names pre-imported, sibling modules importable
+def load_algorithm(path):
+    qc.install()
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    spec = importlib.util.spec_from_file_location("offline_algorithm_" + os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    module.__dict__.update(qc.namespace(QCAlgorithm))
+    spec.loader.exec_module(module)
+    for value in module.__dict__.values():
+        if isinstance(value, type) and issubclass(value, QCAlgorithm) and value is not QCAlgorithm:
+            return value
+    raise ValueError("No QCAlgorithm subclass found in " + path)
+
+class Result:
+
+    def __init__(self, initial_cash, equity, orders, logs):
+        self.initial_cash = initial_cash
+        self.equity = equity
+        self.orders = orders
+        self.logs = logs
+
+    def Summary(self):
+        values = np.array([v for _, v in self.equity]) if self.equity else np.array([self.initial_cash])
+        curve = np.r_[self.initial_cash, values]
+        returns = np.diff(curve) / curve[:-1]
+        sharpe = float(returns.mean() / returns.std() * math.sqrt(252)) if len(returns) > 1 and returns.std() > 0 else 0.0
+        peaks = np.maximum.accumulate(curve)
+        drawdown = float(((peaks - curve) / peaks).max())
+        traded = sum(abs(o["quantity"] * o["price"] * o["multiplier"]) for o in self.orders)
+        return {
+            "start_value": self.initial_cash,
+            "end_value": float(curve[-1]),
+            "pnl": float(curve[-1] - self.initial_cash),
+            "total_return": float(curve[-1] / self.initial_cash - 1),
+            "sharpe": sharpe,
+            "max_drawdown": drawdown,
+            "turnover": float(traded / curve.mean()),
+            "orders": len(self.orders),
+            "days": len(self.equity),
+        }
+
+    def Save(self, folder):
+        os.makedirs(folder, exist_ok = True)
+        with open(os.path.join(folder, "summary.json"), "w") as f:
+            json.dump(self.Summary(), f, indent = 2)
+        with open(os.path.join(folder, "equity.csv"), "w") as f:
+            f.write("date,value\n")
+            for d, v in self.equity:
+                f.write("{},{:.2f}\n".format(d.isoformat(), v))
+        with open(os.path.join(folder, "orders.csv"), "w") as f:
+            f.write("time,symbol,quantity,price,fee,tag\n")
+            for o in self.orders:
+                f.write("{},{},{},{:.4f},{:.2f},{}\n".format(o["time"].isoformat(), o["symbol"].strip(), o["quantity"], o["price"], o["fee"], o["tag"]))
+        with open(os.path.join(folder, "log.txt"), "w") as f:
+            for time, level, message in self.logs:
+                f.write("{} {} {}\n".format(time.isoformat(), level, message))
+
+class Engine:
+
+    def __init__(self, algorithm, data_root, parameters = None, option_source = None, equity_bars = None, fee_per_contract = 0.0, fee_per_share = 0.0, echo = False, mode = "bar",
+                 checkpoint = None, checkpoint_every = 0, resume = None):
+        self.algorithm_class = load_algorithm(algorithm) if isinstance(algorithm, str) else algorithm
+        self.data_root = data_root
+        self.parameters = dict(parameters or {})
+        self.option_source = option_source if option_source is not None else CsvOptionSource(data_root)
+        self.fee_per_contract = fee_per_contract
+        self.fee_per_share = fee_per_share
+        self.echo = echo
+        self.mode = mode
+        if mode == "event" and isinstance(self.option_source, CsvOptionSource):
+            raise ValueError("Event mode needs a chain store: build one with python -m offline.chainstore and pass it with --store")
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.resume = resume
+        self.last_checkpoint = None
+        self.saved = {"orders": 0, "equity": 0, "logs": 0}
+        self.trading_days = 0
+        self.timeline = None
+        self.event_bars = 0
+        self.skipped_bars = 0
+        self.warmup_seconds = 0.0
+        self.start = None
+        self.end = None
+        self.initial_cash = 100000.0
+        self.warmup = datetime.timedelta(0)
+        self.warming_up = False
+        self.time = None
+        self.minute = 0
+        self.portfolio = Portfolio(self)
+        self.Securities = Securities(self)
+        self.equities = []
+        self.options = {}
+        self.consolidators = []
+        self.equity_bars = {}
+        self.preloaded_bars = equity_bars
+        self.option_days = {}
+        self.symbols = {}
+        self.orders = []
+        self.logs = []
+        self.equity_curve = []
+        self.order_id = 0
+
+    def Write(self, level, message):
+        self.logs.append((self.time, level, str(message)))
+        if self.echo:
+            print(self.time, level, message)
+
+    def AddEquity(self, ticker):
+        if ticker in self.Securities:
+            return self.Securities[ticker]
+        self.equities.append(ticker)
+        return self.Securities.Add(Security(self, Symbol(ticker)))
+
+    def AddOption(self, ticker):
+        if ticker not in self.Securities:
+            self.AddEquity(ticker)
+        subscription = OptionSubscription(self, ticker)
+        self.options[ticker] = subscription
+        return subscription
+
+    def OptionSymbol(self, underlying, key, expiry, right, strike):
+        cache_key = (underlying, key)
+        symbol = self.symbols.get(cache_key)
+        if symbol is None:
+            symbol = Symbol.CreateOption(self.Securities[underlying].Symbol, datetime.datetime.fromordinal(int(expiry)), int(right), float(strike))
+            self.symbols[cache_key] = symbol
+        return symbol
+
+    #Last close of an equity at or before the current minute
+    def EquityPrice(self, ticker):
+        bars = self.equity_bars.get(ticker)
+        if bars is None or self.time is None:
+            return 0.0
+        i = int(np.searchsorted(bars.times, np.datetime64(self.time, "m"), side = "right")) - 1
+        return float(bars.close[i]) if i >= 0 else 0.0
+
+    def OptionQuote(self, security):
+        symbol = security.Symbol
+        day = self.option_days.get(str(symbol.Underlying))
+        if day is not None:
+            key = int(contract_key(symbol.ID.Date.toordinal(), symbol.ID.OptionRight, symbol.ID.StrikePrice))
+            row = day.QuoteRow(key, self.minute)
+            if row is not None:
+                security.last_bid = float(day.bid[row])
+                security.last_ask = float(day.ask[row])
+        return security.last_bid, security.last_ask
+
+    def CurrentBars(self):
+        bars = DataDict()
+        now = np.datetime64(self.time, "m")
+        for ticker in self.equities:
+            data = self.equity_bars.get(ticker)
+            if data is None:
+                continue
+            i = int(np.searchsorted(data.times, now, side = "left"))
+            if i < len(data.times) and data.times[i] == now:
+                symbol = self.Securities[ticker].Symbol
+                bars[ticker] = TradeBar(symbol, self.time - datetime.timedelta(minutes = 1), self.time, data.open[i], data.high[i], data.low[i], data.close[i], data.volume[i])
+        return bars
+
+    def CurrentChains(self):
+        chains = []
+        if self.warming_up:
+            return chains
+        for ticker, subscription in self.options.items():
+            day = self.option_days.get(ticker)
+            if day is None:
+                continue
+            start, end = day.Block(self.minute)
+            if start == end:
+                continue
+            underlying_price = self.EquityPrice(ticker)
+            rows = np.flatnonzero(subscription.FilterRows(day, start, end, self.time.date(), underlying_price)) + start
+            underlying = self.Securities[ticker].Symbol
+            contracts = []
+            for i in rows:
+                symbol = self.OptionSymbol(ticker, day.Key(i), day.expiry[i], day.right[i], day.strike[i])
+                greeks = Greeks(float(day.delta[i]), float(day.gamma[i]), float(day.vega[i]), float(day.theta[i]))
+                contracts.append(OptionContract(symbol, underlying, symbol.ID.Date, float(day.strike[i]), int(day.right[i]), float(day.bid[i]), float(day.ask[i]), underlying_price, float(day.iv[i]), greeks, self.time))
+            chains.append(KeyValuePair(subscription.Symbol, OptionChain(subscription.Symbol, self.Securities[ticker], contracts)))
+        return chains
+
+    #Quote bars for option contracts the portfolio holds that were quoted this minute
+    def CurrentQuotes(self):
+        quotes = DataDict()
+        for holding in self.portfolio.holdings.values():
+            symbol = holding.Symbol
+            if not holding.Invested or symbol.SecurityType != SecurityType.Option:
+                continue
+            day = self.option_days.get(str(symbol.Underlying))
+            if day is None:
+                continue
+            row = day.QuoteRow(int(contract_key(symbol.ID.Date.toordinal(), symbol.ID.OptionRight, symbol.ID.StrikePrice)), self.minute)
+            if row is not None and day.minute[row] == self.minute:
+                quotes[str(symbol)] = QuoteBar(symbol, self.time, float(day.bid[row]), float(day.ask[row]))
+        return quotes
+
+    #Daily history as a list of slices with .Bars, for History(periods, Resolution.Daily) or History(symbols, periods, Resolution.Daily)
+    def History(self, *args):
+        if len(args) == 2:
+            tickers, periods, resolution = list(self.equities), args[0], args[1]
+        else:
+            symbols = args[0] if isinstance(args[0], (list, tuple)) else [args[0]]
+            tickers, periods, resolution = [str(s) for s in symbols], args[1], args[2]
+        if resolution != Resolution.Daily:
+            raise NotImplementedError("Offline engine only serves daily history")
+        today = self.time.date()
+        days = {}
+        for ticker in tickers:
+            data = self.equity_bars.get(ticker)
+            if data is None:
+                continue
+            count = int(np.searchsorted(np.array(data.dates, dtype = "datetime64[D]"), np.datetime64(today, "D"), side = "left"))
+            for i in range(max(count - int(periods), 0), count):
+                o, h, l, c, v = data.DailyBar(i)
+                days.setdefault(data.dates[i], DataDict())[ticker] = TradeBar(self.Securities[ticker].Symbol, data.dates[i], data.dates[i], o, h, l, c, v)
+        slices = []
+        for date in sorted(days)[-int(periods):]:
+            s = Slice(self, datetime.datetime.combine(date, datetime.time(16, 0)))
+            s._bars = days[date]
+            slices.append(s)
+        return slices
+
+    def MarginRequirement(self, symbol, quantity):
+        if quantity == 0:
+            return 0.0
+        security = self.Securities[symbol]
+        if security.Type != SecurityType.Option:
+            return abs(quantity) * security.Price * 0.5
+        premium = abs(quantity) * security.Price * OPTION_MULTIPLIER
+        if quantity > 0:
+            return premium
+        underlying = self.EquityPrice(str(symbol.Underlying))
+        strike = symbol.ID.StrikePrice
+        if symbol.ID.OptionRight == OptionRight.Call:
+            otm, floor = max(strike - underlying, 0.0), 0.1 * underlying
+        else:
+            otm, floor = max(underlying - strike, 0.0), 0.1 * strike
+        return premium + abs(quantity) * OPTION_MULTIPLIER * max(0.2 * underlying - otm, floor)
+
+    def _fill(self, security, quantity, price, tag):
+        holding = self.portfolio[security.Symbol]
+        multiplier = security.Multiplier
+        fee = abs(quantity) * (self.fee_per_contract if security.Type == SecurityType.Option else self.fee_per_share)
+        new_quantity = holding.Quantity + quantity
+        if new_quantity == 0:
+            holding.AveragePrice = 0.0
+        elif holding.Quantity == 0 or (holding.Quantity > 0) != (new_quantity > 0):
+            holding.AveragePrice = price
+        elif abs(new_quantity) > abs(holding.Quantity):
+            holding.AveragePrice = (holding.AveragePrice * holding.Quantity + price * quantity) / new_quantity
+        holding.Quantity = new_quantity
+        self.portfolio.Cash -= quantity * price * multiplier + fee
+        self.order_id += 1
+        self.orders.append({"time": self.time, "symbol": str(security.Symbol), "quantity": quantity, "price": price, "multiplier": multiplier, "fee": fee, "tag": tag})
+        event = OrderEvent(self.order_id, security.Symbol, self.time, quantity, price, OrderStatus.Filled, fee)
+        handler = getattr(self.algorithm, "OnOrderEvent", None)
+        if handler is not None:
+            handler(event)
+        return OrderTicket(self.order_id, security.Symbol, quantity, OrderStatus.Filled, price)
+
+    def MarketOrder(self, symbol, quantity, tag = ""):
+        security = self.Securities[symbol]
+        quantity = int(quantity)
+        if quantity == 0:
+            return OrderTicket(0, security.Symbol, 0, OrderStatus.Invalid)
+        bid, ask = security._quote()
+        price = ask if quantity > 0 else bid
+        if not price > 0:
+            self.Write("ERROR", "No quote to fill order for " + str(symbol))
+            return OrderTicket(0, security.Symbol, quantity, OrderStatus.Invalid)
+        holding = self.portfolio[security.Symbol]
+        if abs(holding.Quantity + quantity) > abs(holding.Quantity):
+            margin_after = self.portfolio.TotalMarginUsed - self.MarginRequirement(security.Symbol, holding.Quantity) + self.MarginRequirement(security.Symbol, holding.Quantity + quantity)
+            value_after = self.portfolio.TotalPortfolioValue - quantity * (price - security.Price) * security.Multiplier
+            if value_after - margin_after < 0:
+                self.Write("ERROR", "Insufficient margin for order " + str(quantity) + " " + str(symbol))
+                return OrderTicket(0, security.Symbol, quantity, OrderStatus.Invalid)
+        return self._fill(security, quantity, price, tag)
+
+    #Fill every leg of a combo or none: one margin check on the combined position, then each leg at its bid or ask
+    def ComboMarketOrder(self, legs, quantity, tag = ""):
+        orders = []
+        for leg in legs:
+            security = self.Securities[leg.Symbol]
+            n = int(leg.Quantity * quantity)
+            bid, ask = security._quote()
+            price = ask if n > 0 else bid
+            if n != 0 and not price > 0:
+                self.Write("ERROR", "No quote to fill combo order for " + str(leg.Symbol))
+                return [OrderTicket(0, self.Securities[l.Symbol].Symbol, int(l.Quantity * quantity), OrderStatus.Invalid) for l in legs]
+            orders.append((security, n, price))
+        after = {}
+        for security, n, price in orders:
+            key = str(security.Symbol)
+            after[key] = after.get(key, self.portfolio[security.Symbol].Quantity) + n
+        if any(abs(after[str(security.Symbol)]) > abs(self.portfolio[security.Symbol].Quantity) for security, n, price in orders):
+            margin_after = self.portfolio.TotalMarginUsed
+            for key, quantity_after in after.items():
+                holding = self.portfolio.holdings[key]
+                margin_after += self.MarginRequirement(holding.Symbol, quantity_after) - self.MarginRequirement(holding.Symbol, holding.Quantity)
+            value_after = self.portfolio.TotalPortfolioValue - sum(n * (price - security.Price) * security.Multiplier for security, n, price in orders)
+            if value_after - margin_after < 0:
+                self.Write("ERROR", "Insufficient margin for combo order " + " ".join("{} {}".format(n, security.Symbol) for security, n, price in orders))
+                return [OrderTicket(0, security.Symbol, n, OrderStatus.Invalid) for security, n, price in orders]
+        return [self._fill(security, n, price, tag) if n != 0 else OrderTicket(0, security.Symbol, 0, OrderStatus.Invalid) for security, n, price in orders]
+
+    def Liquidate(self, symbol = None):
+        if symbol is None:
+            holdings = [h for h in self.portfolio.holdings.values() if h.Invested]
+        else:
+            holdings = [self.portfolio[symbol]]
+        return [self.MarketOrder(h.Symbol, -h.Quantity, "Liquidated") for h in holdings if h.Invested]
+
+    #Whole-contract quantity that moves the holding to a target fraction of portfolio value, truncated toward zero
+    def CalculateOrderQuantity(self, symbol, target):
+        security = self.Securities[symbol]
+        holding = self.portfolio[security.Symbol]
+        delta_value = target * self.portfolio.TotalPortfolioValue - holding.HoldingsValue
+        price = security.AskPrice if delta_value > 0 else security.BidPrice
+        if not price > 0:
+            return 0
+        return int(delta_value / (price * security.Multiplier))
+
+    #Cash-settle options that expire today at intrinsic value
+    def SettleExpiries(self, date):
+        ordinal = date.toordinal()
+        for holding in list(self.portfolio.holdings.values()):
+            symbol = holding.Symbol
+            if not holding.Invested or symbol.SecurityType != SecurityType.Option or symbol.ID.Date.toordinal() > ordinal:
+                continue
+            underlying = self.EquityPrice(str(symbol.Underlying))
+            if symbol.ID.OptionRight == OptionRight.Call:
+                intrinsic = max(underlying - symbol.ID.StrikePrice, 0.0)
+            else:
+                intrinsic = max(symbol.ID.StrikePrice - underlying, 0.0)
+            self._fill(self.Securities[symbol], -holding.Quantity, intrinsic, "Expired")
+
+    def LoadData(self):
+        tickers = list(self.equities)
+        if self.preloaded_bars is not None:
+            missing = [t for t in tickers if t not in self.preloaded_bars]
+            self.equity_bars = dict((t, self.preloaded_bars[t]) for t in tickers if t in self.preloaded_bars)
+            self.equity_bars.update(load_equities(self.data_root, missing))
+        else:
+            self.equity_bars = load_equities(self.data_root, tickers)
+        primary = [t for t in tickers if t in self.equity_bars]
+        if not primary:
+            raise ValueError("No equity data found under " + self.data_root)
+        return self.equity_bars[primary[0]]
+
+    #warmup_only stops once warm-up is done (after writing its checkpoint) and returns None
+    def Run(self, warmup_only = False):
+        started = timer.perf_counter()
+        self.algorithm = self.algorithm_class()
+        self.algorithm._engine = self
+        self.algorithm.Initialize()
+        clock = self.LoadData()
+        begin = self.start - self.warmup
+        days = [i for i, d in enumerate(clock.dates) if begin <= d <= self.end]
+        self.warming_up = bool(days) and clock.dates[days[0]] < self.start
+        if self.resume is not None:
+            state = checkpoint.read(self.resume)
+            resumed = datetime.date.fromisoformat(state["date"])
+            days = [i for i in days if clock.dates[i] > resumed]
+            if state["start"] != self.start.isoformat():
+                raise ValueError("Checkpoint " + state["path"] + " is for a run starting " + state["start"] + ", not " + self.start.isoformat())
+            self.RestoreState(state)
+            self.warming_up = False
+        if warmup_only and not self.warming_up:
+            return None
+        if self.mode == "event":
+            self.timeline = SignalTimeline(self, clock, days)
+        last_date = None
+        for day_index in days:
+            date = clock.dates[day_index]
+            if self.warming_up and date >= self.start:
+                self.warming_up = False
+                self.warmup_seconds = timer.perf_counter() - started
+                self.time = datetime.datetime.combine(date, datetime.time(9, 30))
+                handler = getattr(self.algorithm, "OnWarmupFinished", None)
+                if handler is not None:
+                    handler()
+                if self.checkpoint is not None:
+                    self.WriteCheckpoint(last_date, True)
+                if warmup_only:
+                    return None
+            self.option_days = {} if self.warming_up else {t: self.option_source.Day(t, date) for t in self.options}
+            start, end = clock.day_starts[day_index], clock.day_ends[day_index]
+            if self.timeline is not None:
+                self.ReplayEvents(clock.times[start:end], date)
+            else:
+                for time in clock.times[start:end].astype(datetime.datetime).tolist():
+                    self.time = time
+                    self.minute = time.hour * 60 + time.minute
+                    self.algorithm.OnData(Slice(self, time))
+            self.EndOfDay(date)
+            last_date = date
+            if not self.warming_up:
+                self.trading_days += 1
+                if self.checkpoint is not None and self.checkpoint_every > 0 and self.trading_days % self.checkpoint_every == 0:
+                    self.WriteCheckpoint(date)
+        handler = getattr(self.algorithm, "OnEndOfAlgorithm", None)
+        if handler is not None:
+            handler()
+        return Result(self.initial_cash, self.equity_curve, self.orders, self.logs)
+
+    def WriteCheckpoint(self, date, warmup = False):
+        self.last_checkpoint = checkpoint.write(self.checkpoint, self.CaptureState(date, warmup))
+        self.saved = {"orders": len(self.orders), "equity": len(self.equity_curve), "logs": len(self.logs)}
+
+    #Engine and algorithm state after the last completed trading day `date`; fills, equity points and log lines only
+    #since the previous checkpoint (see offline.checkpoint), and the run's start, data and parameters for reuse checks
+    def CaptureState(self, date, warmup = False):
+        capture = getattr(self.algorithm, "CaptureState", None)
+        if capture is None:
+            raise ValueError("Algorithm does not implement CaptureState, cannot checkpoint")
+        securities = self.Securities.securities.values()
+        return {
+            "version": checkpoint.VERSION,
+            "date": date.isoformat(),
+            "warmup": warmup,
+            "previous": self.last_checkpoint,
+            "start": self.start.isoformat(),
+            "data": os.path.abspath(self.data_root),
+            "source": os.path.abspath(self.option_source.root) if getattr(self.option_source, "root", None) else None,
+            "parameters": self.parameters,
+            "time": self.time.isoformat(),
+            "trading_days": self.trading_days,
+            "cash": self.portfolio.Cash,
+            "holdings": {key: [h.Quantity, h.AveragePrice] for key, h in self.portfolio.holdings.items() if h.Invested},
+            "quotes": {str(s.Symbol): [s.last_bid, s.last_ask] for s in securities if s.Type == SecurityType.Option and (s.last_bid > 0 or s.last_ask > 0)},
+            "order_id": self.order_id,
+            "orders": [[o["time"].isoformat(), o["symbol"], o["quantity"], o["price"], o["multiplier"], o["fee"], o["tag"]] for o in self.orders[self.saved["orders"]:]],
+            "equity": [[d.isoformat(), v] for d, v in self.equity_curve[self.saved["equity"]:]],
+            "logs": [[t.isoformat() if t is not None else None, level, message] for t, level, message in self.logs[self.saved["logs"]:]],
+            "event_bars": self.event_bars,
+            "skipped_bars": self.skipped_bars,
+            "algorithm": capture(),
+        }
+
+    def _symbol(self, key):
+        return self.Securities[key].Symbol if key in self.Securities else SymbolRepresentation.ParseOptionTickerOSI(key)
+
+    def RestoreState(self, state):
+        restore = getattr(self.algorithm, "RestoreState", None)
+        if restore is None:
+            raise ValueError("Algorithm does not implement RestoreState, cannot resume")
+        self.time = datetime.datetime.fromisoformat(state["time"])
+        self.minute = self.time.hour * 60 + self.time.minute
+        self.trading_days = state["trading_days"]
+        self.portfolio.Cash = state["cash"]
+        for key, (quantity, average) in state["holdings"].items():
+            holding = self.portfolio[self._symbol(key)]
+            holding.Quantity = quantity
+            holding.AveragePrice = average
+        for key, (bid, ask) in state["quotes"].items():
+            security = self.Securities[self._symbol(key)]
+            security.last_bid, security.last_ask = bid, ask
+        self.order_id = state["order_id"]
+        self.orders = [{"time": datetime.datetime.fromisoformat(t), "symbol": symbol, "quantity": quantity, "price": price, "multiplier": multiplier, "fee": fee, "tag": tag}
+                       for t, symbol, quantity, price, multiplier, fee, tag in state["orders"]]
+        self.equity_curve = [(datetime.date.fromisoformat(d), v) for d, v in state["equity"]]
+        self.logs = [(datetime.datetime.fromisoformat(t) if t is not None else None, level, message) for t, level, message in state["logs"]]
+        self.event_bars = state["event_bars"]
+        self.skipped_bars = state["skipped_bars"]
+        self.last_checkpoint = state["path"]
+        self.saved = {"orders": len(self.orders), "equity": len(self.equity_curve), "logs": len(self.logs)}
+        restore(state["algorithm"])
+
+    #Event mode: skip warm-up bars entirely and only wake OnData at minutes the timeline marks as relevant
+    def ReplayEvents(self, times, date):
+        if self.warming_up:
+            self.time = times[-1].astype(datetime.datetime)
+            self.minute = self.time.hour * 60 + self.time.minute
+            return
+        vix_minutes = self.timeline.VixMinutes(date)
+        for time in times.astype(datetime.datetime).tolist():
+            self.time = time
+            self.minute = time.hour * 60 + time.minute
+            if self.timeline.Relevant(date, self.minute, vix_minutes):
+                self.algorithm.OnData(Slice(self, time))
+                self.event_bars += 1
+            else:
+                self.skipped_bars += 1
+
+    def EndOfDay(self, date):
+        for ticker, handler in self.consolidators:
+            data = self.equity_bars.get(ticker)
+            if data is None or date not in data.day_lookup:
+                continue
+            o, h, l, c, v = data.DailyBar(data.day_lookup[date])
+            handler(TradeBar(self.Securities[ticker].Symbol, datetime.datetime.combine(date, datetime.time(9, 30)), datetime.datetime.combine(date, datetime.time(16, 0)), o, h, l, c, v))
+        self.SettleExpiries(date)
+        if not self.warming_up:
+            self.equity_curve.append((date, self.portfolio.TotalPortfolioValue))
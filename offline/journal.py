@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+from collections import Counter
+
+CODE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code")
+if CODE not in sys.path:
+    sys.path.insert(0, CODE)
+from journal import Journal, KINDS, REASONS, EXIT
+
+#Read a trade journal written with python -m offline --journal: filter records and print them, or count exits by reason
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m offline.journal", description = "Query a structured trade journal")
+    parser.add_argument("path", help = "journal prefix, e.g. results/journal")
+    parser.add_argument("--kind", choices = sorted(KINDS.values()))
+    parser.add_argument("--reason", choices = sorted(r for r in REASONS.values() if r))
+    parser.add_argument("--ticker")
+    parser.add_argument("--strategy")
+    parser.add_argument("--summary", action = "store_true", help = "count records by kind, and exits by reason and strategy")
+    args = parser.parse_args(argv)
+    if args.path.endswith(".bin") or args.path.endswith(".json"):
+        args.path = os.path.splitext(args.path)[0]
+    journal = Journal.Load(args.path)
+    kind = {name: k for k, name in KINDS.items()}.get(args.kind)
+    reason = {name: r for r, name in REASONS.items()}.get(args.reason)
+    records = journal.Query(kind, reason, args.ticker, args.strategy)
+    if not args.summary:
+        for line in journal.Format(records):
+            print(line)
+        return
+    kinds = Counter(KINDS[int(k)] for k in records["kind"])
+    exits = records[records["kind"] == EXIT]
+    reasons = Counter((REASONS[int(r["reason"])], journal.tables["strategies"][r["strategy"]]) for r in exits)
+    print("{} records: {}".format(len(records), ", ".join("{} {}".format(n, name) for name, n in sorted(kinds.items()))))
+    for (name, strategy), n in sorted(reasons.items(), key = lambda item: -item[1]):
+        print("{:>6}  {:<12} {}".format(n, name, strategy))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,225 @@
+import sys
+import types
+import datetime
+
+#Minimal stand-ins for the QuantConnect/LEAN types that Code/main.py touches
+#Names and members mirror LEAN so the algorithm source runs unmodified
+
+class Resolution:
+    Tick = "Tick"
+    Second = "Second"
+    Minute = "Minute"
+    Hour = "Hour"
+    Daily = "Daily"
+
+class TimeSpan:
+
+    @staticmethod
+    def FromDays(days):
+        return datetime.timedelta(days = days)
+
+    @staticmethod
+    def FromHours(hours):
+        return datetime.timedelta(hours = hours)
+
+    @staticmethod
+    def FromMinutes(minutes):
+        return datetime.timedelta(minutes = minutes)
+
+class OptionRight:
+    Call = 0
+    Put = 1
+
+class SecurityType:
+    Equity = "Equity"
+    Option = "Option"
+
+class OrderStatus:
+    Filled = "Filled"
+    PartiallyFilled = "PartiallyFilled"
+    Invalid = "Invalid"
+
+class OrderDirection:
+    Buy = "Buy"
+    Sell = "Sell"
+
+#Price models are markers only: the engine reads implied vol and Greeks from the data files
+class OptionPriceModels:
+
+    @staticmethod
+    def CrankNicolsonFD():
+        return "CrankNicolsonFD"
+
+    @staticmethod
+    def BlackScholes():
+        return "BlackScholes"
+
+#Dict with the .NET dictionary members the algorithm uses
+class DataDict(dict):
+
+    def ContainsKey(self, key):
+        return key in self
+
+class SymbolId:
+
+    def __init__(self, date = None, strike = None, right = None):
+        self.Date = date
+        self.StrikePrice = strike
+        self.OptionRight = right
+
+#Symbols compare and hash as their ticker string so Securities/Portfolio accept either form
+class Symbol(str):
+
+    def __new__(cls, value, security_type = SecurityType.Equity, underlying = None, expiry = None, strike = None, right = None):
+        symbol = str.__new__(cls, value)
+        symbol.Value = str(value)
+        symbol.SecurityType = security_type
+        symbol.Underlying = underlying
+        symbol.ID = SymbolId(expiry, strike, right)
+        return symbol
+
+    @staticmethod
+    def CreateOption(underlying, expiry, right, strike):
+        value = "{:<6}{}{}{:08d}".format(str(underlying), expiry.strftime("%y%m%d"), "C" if right == OptionRight.Call else "P", int(round(strike * 1000)))
+        return Symbol(value, SecurityType.Option, underlying, expiry, strike, right)
+
+#Parse OSI option tickers ("SPY   160108C00186000") back into option symbols
+class SymbolRepresentation:
+
+    @staticmethod
+    def ParseOptionTickerOSI(ticker):
+        ticker = str(ticker)
+        expiry = datetime.datetime.strptime(ticker[6:12], "%y%m%d")
+        right = OptionRight.Call if ticker[12] == "C" else OptionRight.Put
+        return Symbol.CreateOption(Symbol(ticker[:6].strip()), expiry, right, int(ticker[13:]) / 1000.0)
+
+class TradeBar:
+
+    def __init__(self, symbol, time, end_time, open, high, low, close, volume):
+        self.Symbol = symbol
+        self.Time = time
+        self.EndTime = end_time
+        self.Open = open
+        self.High = high
+        self.Low = low
+        self.Close = close
+        self.Volume = volume
+        self.Value = close
+
+class QuoteBar:
+
+    def __init__(self, symbol, time, bid, ask):
+        self.Symbol = symbol
+        self.EndTime = time
+        self.Bid = bid
+        self.Ask = ask
+        self.Close = (bid + ask) / 2 if bid > 0 and ask > 0 else max(bid, ask)
+
+class Greeks:
+
+    def __init__(self, delta = 0.0, gamma = 0.0, vega = 0.0, theta = 0.0, rho = 0.0):
+        self.Delta = delta
+        self.Gamma = gamma
+        self.Vega = vega
+        self.Theta = theta
+        self.Rho = rho
+
+class OptionContract:
+
+    def __init__(self, symbol, underlying_symbol, expiry, strike, right, bid, ask, underlying_price, implied_vol, greeks, time):
+        self.Symbol = symbol
+        self.UnderlyingSymbol = underlying_symbol
+        self.Expiry = expiry
+        self.Strike = strike
+        self.Right = right
+        self.BidPrice = bid
+        self.AskPrice = ask
+        self.LastPrice = (bid + ask) / 2
+        self.UnderlyingLastPrice = underlying_price
+        self.ImpliedVolatility = implied_vol
+        self.Greeks = greeks
+        self.Time = time
+
+    def __str__(self):
+        return str(self.Symbol)
+
+class OptionChain(list):
+
+    def __init__(self, canonical, underlying, contracts):
+        list.__init__(self, contracts)
+        self.Symbol = canonical
+        self.Underlying = underlying
+
+    @property
+    def Contracts(self):
+        return DataDict((x.Symbol, x) for x in self)
+
+class KeyValuePair:
+
+    def __init__(self, key, value):
+        self.Key = key
+        self.Value = value
+
+class OrderEvent:
+
+    def __init__(self, order_id, symbol, time, quantity, price, status, fee = 0.0):
+        self.OrderId = order_id
+        self.Symbol = symbol
+        self.UtcTime = time
+        self.FillQuantity = quantity
+        self.Quantity = quantity
+        self.FillPrice = price
+        self.Status = status
+        self.OrderFee = fee
+        self.Direction = OrderDirection.Buy if quantity > 0 else OrderDirection.Sell
+
+class OrderTicket:
+
+    def __init__(self, order_id, symbol, quantity, status, fill_price = 0.0):
+        self.OrderId = order_id
+        self.Symbol = symbol
+        self.Quantity = quantity
+        self.QuantityFilled = quantity if status == OrderStatus.Filled else 0
+        self.AverageFillPrice = fill_price
+        self.Status = status
+
+#One leg of a combo order: the leg's quantity is multiplied by the combo quantity
+class Leg:
+
+    def __init__(self, symbol, quantity):
+        self.Symbol = symbol
+        self.Quantity = quantity
+
+    @staticmethod
+    def Create(symbol, quantity):
+        return Leg(symbol, quantity)
+
+#Names injected into the algorithm module namespace, as the LEAN Python runtime does
+def namespace(algorithm_base):
+    return {
+        "QCAlgorithm": algorithm_base,
+        "Resolution": Resolution,
+        "TimeSpan": TimeSpan,
+        "OptionRight": OptionRight,
+        "SecurityType": SecurityType,
+        "OrderStatus": OrderStatus,
+        "OptionPriceModels": OptionPriceModels,
+        "Symbol": Symbol,
+        "SymbolRepresentation": SymbolRepresentation,
+        "Leg": Leg,
+        "TradeBar": TradeBar,
+    }
+
+#Register the QuantConnect.* modules the algorithm imports from
+def install():
+    if "QuantConnect" in sys.modules:
+        return
+    names = ["QuantConnect", "QuantConnect.Securities", "QuantConnect.Securities.Option", "QuantConnect.Algorithm", "QuantConnect.Data", "QuantConnect.Data.Market", "QuantConnect.Orders"]
+    for name in names:
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules["QuantConnect"].Resolution = Resolution
+    sys.modules["QuantConnect"].SecurityType = SecurityType
+    sys.modules["QuantConnect"].OptionRight = OptionRight
+    sys.modules["QuantConnect.Securities.Option"].OptionPriceModels = OptionPriceModels
+    sys.modules["QuantConnect.Data.Market"].TradeBar = TradeBar
+    sys.modules["QuantConnect.Orders"].OrderStatus = OrderStatus
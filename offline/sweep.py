@@ -0,0 +1,147 @@
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+
+from offline.engine import Engine, load_algorithm
+from offline.data import load_equities, equity_tickers
+from offline.chainstore import ChainStore
+from offline import checkpoint
+
+#Parameter sweep over OptionTrading's GetParameter knobs, one offline backtest per configuration across a process pool
+#Equity bars are loaded once in the parent and inherited copy-on-write by forked workers; option chains come from
+#the memory-mapped store when one is given, so every worker reads the same page cache
+#With a checkpoint folder, warm-up is replayed once with the parameters all configurations share and every run
+#resumes from that checkpoint instead of warming up itself
+
+METRICS = ["sharpe", "max_drawdown", "turnover", "pnl", "total_return", "orders"]
+
+_shared = {}
+
+def grid(space):
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+#space maps a name to ("uniform", lo, hi), ("randint", lo, hi) or ("choice", [values])
+def random_search(space, n, seed = 0):
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, spec in sorted(space.items()):
+            if spec[0] == "uniform":
+                config[name] = round(rng.uniform(spec[1], spec[2]), 6)
+            elif spec[0] == "randint":
+                config[name] = rng.randint(spec[1], spec[2])
+            else:
+                config[name] = rng.choice(spec[1])
+        configs.append(config)
+    return configs
+
+def _load(algorithm, data_root, store_root, resume = None):
+    _shared["algorithm"] = load_algorithm(algorithm)
+    _shared["data"] = data_root
+    _shared["bars"] = load_equities(data_root, equity_tickers(data_root))
+    _shared["store"] = store_root
+    _shared["resume"] = resume
+
+def _init(algorithm, data_root, store_root, resume = None):
+    if not _shared:
+        _load(algorithm, data_root, store_root, resume)
+
+#Warm-up checkpoint in `folder` for the parameters shared by every configuration; one is reused only when it was
+#written over the same data and chain source with exactly those parameters, otherwise a warm-up-only run writes it
+#(the start date is checked by the engine when it resumes)
+def warmup(configs, folder):
+    shared = dict((name, value) for name, value in configs[0].items() if all(config.get(name) == value for config in configs))
+    source = _shared["store"] or _shared["data"]
+    for path in reversed(checkpoint.listing(folder, warmup = True)):
+        if checkpoint.matches(path, _shared["data"], source, shared):
+            return path
+    option_source = ChainStore(_shared["store"]) if _shared["store"] else None
+    engine = Engine(_shared["algorithm"], _shared["data"], parameters = shared, option_source = option_source, equity_bars = _shared["bars"], checkpoint = folder)
+    engine.Run(warmup_only = True)
+    return engine.last_checkpoint
+
+def _run(job):
+    i, config = job
+    started = time.time()
+    option_source = ChainStore(_shared["store"]) if _shared["store"] else None
+    engine = Engine(_shared["algorithm"], _shared["data"], parameters = config, option_source = option_source, equity_bars = _shared["bars"], resume = _shared["resume"])
+    summary = engine.Run().Summary()
+    row = {"run": i}
+    row.update(config)
+    row.update({name: summary[name] for name in METRICS})
+    row["seconds"] = round(time.time() - started, 2)
+    return row
+
+def run(configs, algorithm, data_root, store_root = None, workers = None, checkpoint_folder = None):
+    _shared.clear()
+    _load(algorithm, data_root, store_root)
+    if checkpoint_folder is not None and configs:
+        _shared["resume"] = warmup(configs, checkpoint_folder)
+    workers = workers or os.cpu_count() or 1
+    jobs = list(enumerate(configs))
+    if workers == 1:
+        return [_run(job) for job in jobs]
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(method)
+    with context.Pool(workers, initializer = _init, initargs = (algorithm, data_root, store_root, _shared["resume"])) as pool:
+        rows = list(pool.imap_unordered(_run, jobs))
+    return sorted(rows, key = lambda row: row["run"])
+
+def write_table(rows, path):
+    names = []
+    for row in rows:
+        names.extend(name for name in row if name not in names)
+    with open(path, "w", newline = "") as f:
+        writer = csv.DictWriter(f, fieldnames = names)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _values(text):
+    name, values = text.split("=", 1)
+    return name, values.split(",")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m offline.sweep", description = "Grid or random parameter sweep of an algorithm over local data")
+    parser.add_argument("--data", required = True)
+    parser.add_argument("--store", help = "memory-mapped chain store shared by all workers")
+    parser.add_argument("--algorithm", default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code", "main.py"))
+    parser.add_argument("--grid", action = "append", default = [], metavar = "NAME=V1,V2,...")
+    parser.add_argument("--random", type = int, default = 0, metavar = "N", help = "draw N random configurations instead of the full grid")
+    parser.add_argument("--uniform", action = "append", default = [], metavar = "NAME=LO:HI")
+    parser.add_argument("--randint", action = "append", default = [], metavar = "NAME=LO:HI")
+    parser.add_argument("--choice", action = "append", default = [], metavar = "NAME=V1,V2,...")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--checkpoint", metavar = "DIR", help = "share one warm-up checkpoint (created here if missing) across all runs")
+    parser.add_argument("--out", default = "sweep.csv")
+    args = parser.parse_args(argv)
+    if args.random:
+        space = {}
+        for text in args.uniform:
+            name, bounds = text.split("=", 1)
+            space[name] = ("uniform", float(bounds.split(":")[0]), float(bounds.split(":")[1]))
+        for text in args.randint:
+            name, bounds = text.split("=", 1)
+            space[name] = ("randint", int(bounds.split(":")[0]), int(bounds.split(":")[1]))
+        for text in args.choice + args.grid:
+            name, values = _values(text)
+            space[name] = ("choice", values)
+        configs = random_search(space, args.random, args.seed)
+    else:
+        configs = grid(dict(_values(text) for text in args.grid))
+    started = time.time()
+    rows = run(configs, args.algorithm, args.data, args.store, args.workers, args.checkpoint)
+    write_table(rows, args.out)
+    print("{} configurations in {:.1f}s -> {}".format(len(rows), time.time() - started, args.out))
+    for row in sorted(rows, key = lambda row: -row["sharpe"])[:5]:
+        print(row)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
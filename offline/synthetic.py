@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import shutil
+import datetime
+import numpy as np
+
+from offline.data import EquityBars
+from offline.chainstore import ChainStoreWriter, FIELDS
+
+#Synthetic market data for benchmarks: GBM minute paths per underlying and Black-Scholes priced chains around them
+#Equity bars are rebuilt in memory from the seed; chains are written once into a chain store and reused while the
+#configuration is unchanged
+
+CODE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code")
+if CODE not in sys.path:
+    sys.path.insert(0, CODE)
+from pricing import price, greeks
+
+#Minute-of-day stamps of regular session bars (bar end times 09:31 .. 16:00)
+SESSION = np.arange(9 * 60 + 31, 16 * 60 + 1)
+
+DEFAULTS = {
+    "underlyings": 1,
+    "strikes": 15,
+    "expiries": 3,
+    "days": 5,
+    "warmup_days": 45,
+    "quote_every": 1,
+    "start": "2016-01-04",
+    "seed": 0,
+}
+
+def tickers(n):
+    return ["SYN{:02d}".format(i) for i in range(n)]
+
+def trading_days(first, count, before = 0):
+    days = []
+    day = first
+    while len(days) < before:
+        day -= datetime.timedelta(days = 1)
+        if day.weekday() < 5:
+            days.insert(0, day)
+    day = first
+    while len(days) < before + count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += datetime.timedelta(days = 1)
+    return days
+
+#Minute closes of a driftless GBM, one row per day
+def gbm(rng, spot, sigma, days):
+    steps = rng.normal(0.0, sigma / np.sqrt(252 * len(SESSION)), (days, len(SESSION)))
+    return spot * np.exp(np.cumsum(steps.ravel())).reshape(days, len(SESSION))
+
+def equity_bars(ticker, dates, closes):
+    times = (np.array(dates, dtype = "datetime64[D]")[:, None].astype("datetime64[m]") + SESSION[None, :]).ravel()
+    close = closes.ravel()
+    opens = np.r_[close[0], close[:-1]]
+    return EquityBars(ticker, times, opens, np.maximum(opens, close), np.minimum(opens, close), close, np.full(len(close), 1000.0))
+
+#Weekly Friday expiries from the week of `date` on
+def fridays(date, count):
+    first = date + datetime.timedelta(days = (4 - date.weekday()) % 7)
+    return [first + datetime.timedelta(days = 7 * k) for k in range(count)]
+
+#One day of quotes: every `quote_every` minutes, each expiry, both rights, strikes at unit spacing around the open
+def chain_day(date, closes, strikes, expiries, quote_every):
+    stamps = np.flatnonzero(SESSION % quote_every == 0)
+    minute = SESSION[stamps]
+    spot = closes[stamps]
+    strike = np.round(closes[0]) + np.arange(-strikes, strikes + 1, dtype = np.float64)
+    expiry = np.array([d.toordinal() for d in fridays(date, expiries)])
+    shape = (len(stamps), len(expiry), 2, len(strike))
+    m, e, r, k = [np.broadcast_to(a, shape).ravel() for a in (minute[:, None, None, None], expiry[None, :, None, None], np.arange(2)[None, None, :, None], strike[None, None, None, :])]
+    s = np.broadcast_to(spot[:, None, None, None], shape).ravel()
+    T = np.maximum(((e - date.toordinal()) * 1440 + 16 * 60 - m) / (365.0 * 1440), 1e-4)
+    iv = 0.15 + 0.5 * np.abs(np.log(k / s))
+    mid = np.maximum(price(s, k, T, 0.0, 0.0, iv, r), 0.01)
+    g = greeks(s, k, T, 0.0, 0.0, iv, r)
+    return {
+        "minute": m,
+        "expiry": e,
+        "strike": k,
+        "right": r,
+        "bid": np.round(mid * 0.98, 2),
+        "ask": np.round(mid * 1.02 + 0.01, 2),
+        "iv": iv,
+        "delta": g["delta"],
+        "gamma": g["gamma"],
+        "vega": g["vega"],
+        "theta": g["theta"],
+    }
+
+#Equity bars for every underlying plus VIXY, keyed by ticker, and the dates they cover
+def market(config):
+    config = dict(DEFAULTS, **config)
+    rng = np.random.default_rng(config["seed"])
+    start = datetime.date.fromisoformat(config["start"])
+    dates = trading_days(start, config["days"], config["warmup_days"])
+    bars = {}
+    paths = {}
+    for ticker in tickers(config["underlyings"]):
+        paths[ticker] = gbm(rng, rng.uniform(50, 400), rng.uniform(0.1, 0.4), len(dates))
+        bars[ticker] = equity_bars(ticker, dates, paths[ticker])
+    bars["VIXY"] = equity_bars("VIXY", dates, gbm(rng, 20.0, 0.8, len(dates)))
+    return bars, paths, dates
+
+#Write (or reuse) the chain store for a configuration; returns the equity bars, the store folder and the tickers
+def prepare(config, folder):
+    config = dict(DEFAULTS, **config)
+    bars, paths, dates = market(config)
+    store = os.path.join(folder, "store")
+    meta_path = os.path.join(folder, "config.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == config:
+                return bars, store, tickers(config["underlyings"])
+    shutil.rmtree(store, ignore_errors = True)
+    trading = dates[config["warmup_days"]:]
+    for ticker in tickers(config["underlyings"]):
+        writer = ChainStoreWriter(os.path.join(store, ticker.lower()))
+        for i, date in enumerate(trading):
+            columns = chain_day(date, paths[ticker][config["warmup_days"] + i], config["strikes"], config["expiries"], config["quote_every"])
+            writer.AddDay(date, {name: columns[name] for name in FIELDS})
+        writer.Close()
+    with open(meta_path, "w") as f:
+        json.dump(config, f, indent = 2)
+    return bars, store, tickers(config["underlyings"])
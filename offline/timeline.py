@@ -0,0 +1,154 @@
+import math
+import datetime
+import numpy as np
+
+#Precomputed HV-IV signal timeline for OptionTrading and the predicate that decides which minutes can change its state
+#The hourly spreads are computed for the whole backtest in one pass; the engine then calls OnData only at
+#bound crossings, pause bookkeeping at 16:00, due expiries at 15:40, stop-loss breaches on quoted legs, VIX spikes and
+#hedged underlyings whose estimated net delta is outside the hedge band
+#Event mode needs a chain store: the pass reads each hourly chain from its memory-mapped timestamp block, where CSV
+#days would be parsed once here and again during the replay
+#The rules mirror the state machine in Code/main.py OnData; keep them in step when that method changes
+
+#Spreads within this distance of a bound are always replayed so rounding differences can never hide a crossing
+MARGIN = 5e-4
+
+#Annualized population volatility of log returns over the `period` closes before each day, i.e. what the
+#algorithm's estimator holds while that day trades (it is updated from the daily bar after the close)
+def rolling_hv(closes, period, annualization = 252):
+    returns = np.diff(np.log(closes))
+    c1 = np.r_[0.0, np.cumsum(returns)]
+    c2 = np.r_[0.0, np.cumsum(returns * returns)]
+    end = np.arange(len(closes)) - 1
+    start = np.maximum(end - (period - 1), 0)
+    count = end - start
+    valid = count > 0
+    end = np.maximum(end, 0)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        mean = (c1[end] - c1[start]) / count
+        variance = np.maximum((c2[end] - c2[start]) / count - mean * mean, 0.0)
+    return np.where(valid, np.sqrt(variance) * math.sqrt(annualization), np.nan)
+
+class SignalTimeline:
+
+    def __init__(self, engine, clock, day_indices):
+        self.engine = engine
+        algo = engine.algorithm
+        self.spreads = {}
+        tickers = [t for t in algo.positions.Tickers() if t in engine.options and t in engine.equity_bars]
+        for ticker in tickers:
+            bars = engine.equity_bars[ticker]
+            closes = np.array([bars.DailyBar(i)[3] for i in range(len(bars.dates))])
+            hv_long = np.round(rolling_hv(closes, algo.HVPeriod), 4)
+            hv_short = np.round(rolling_hv(closes, algo.shortHVPeriod), 4)
+            subscription = engine.options[ticker]
+            table = {}
+            for day_index in day_indices:
+                date = clock.dates[day_index]
+                if date < engine.start or date not in bars.day_lookup:
+                    continue
+                day = engine.option_source.Day(ticker, date)
+                if day is None:
+                    continue
+                i = bars.day_lookup[date]
+                start, end = bars.day_starts[i], bars.day_ends[i]
+                times = bars.times[start:end]
+                minutes = (times - times.astype("datetime64[D]")).astype(np.int64)
+                for k in np.flatnonzero(minutes % 60 == 0):
+                    iv = self.AtmImpliedVol(day, subscription, int(minutes[k]), date, float(bars.close[start + k]), getattr(algo, "pricer", None))
+                    if np.isnan(iv):
+                        continue
+                    table[(date.toordinal(), int(minutes[k]))] = (round(hv_long[i] - iv, 4), round(hv_short[i] - hv_long[i], 4))
+            self.spreads[ticker] = table
+
+    #Mean implied vol of the ATM call and put at the farthest filtered expiry, or NaN when the chain cannot be scanned
+    #With the algorithm's Black-Scholes pricer (price_model BS) the IVs are solved from the quotes as OnData does,
+    #otherwise they are the data's own
+    def AtmImpliedVol(self, day, subscription, minute, date, price, pricer = None):
+        start, end = day.Block(minute)
+        if start == end:
+            return np.nan
+        rows = np.flatnonzero(subscription.FilterRows(day, start, end, date, price)) + start
+        if len(rows) == 0:
+            return np.nan
+        expiry = day.expiry[rows]
+        rows = rows[expiry == expiry.max()]
+        atm = []
+        for right in (0, 1):
+            side = rows[day.right[rows] == right]
+            if len(side) == 0:
+                return np.nan
+            strikes = day.strike[side].astype(np.float64)
+            order = np.argsort(strikes, kind = "stable")
+            atm.append(side[order][int(np.abs(strikes[order] - price).argmin())])
+        if pricer is None:
+            return float(np.mean([float(day.iv[row]) for row in atm]))
+        now = datetime.datetime.combine(date, datetime.time(minute // 60, minute % 60))
+        expiry = [datetime.datetime.fromordinal(int(day.expiry[row])) for row in atm]
+        ivs = pricer.QuoteImpliedVol(day.bid[atm], day.ask[atm], price, day.strike[atm].astype(np.float64), expiry, day.right[atm], now)
+        return float(np.mean(ivs))
+
+    #Whether OnData at an hourly stamp could act on this ticker given the algorithm's current state
+    def HourRelevant(self, ticker, date, minute):
+        algo = self.engine.algorithm
+        position = algo.positions[ticker]
+        if position.pause > 0:
+            return minute == 16 * 60
+        values = self.spreads.get(ticker, {}).get((date.toordinal(), minute))
+        if values is None:
+            return False
+        spread, vol_spread = values
+        status = position.status
+        near = lambda bound: abs(spread - bound) <= MARGIN
+        long_bound, short_bound = position.long_bound, position.short_bound
+        lower, upper = position.lower_bound, position.upper_bound
+        if near(long_bound) or near(short_bound) or near(lower) or near(upper) or abs(vol_spread - position.vol_spike) <= MARGIN:
+            return True
+        if spread < lower or spread > upper or vol_spread > position.vol_spike:
+            return True
+        if status == algo.LongStrat and spread < long_bound:
+            return True
+        if status == algo.ShortStrat and spread > short_bound:
+            return True
+        if status == "None" and (long_bound < spread <= upper or lower <= spread < short_bound):
+            return True
+        return False
+
+    #Whether a watched position had a leg quoted this minute and is now above its stop
+    def StopRelevant(self):
+        algo = self.engine.algorithm
+        return len(algo.stop_triggers) > 0 and len(algo.stop_triggers.Breached(self.engine.CurrentQuotes(), self.engine.Securities)) > 0
+
+    #Whether a hedged underlying would be repriced this minute (its estimated net delta left the band)
+    def HedgeRelevant(self):
+        algo = self.engine.algorithm
+        if not getattr(algo, "delta_hedge_on", False) or len(algo.ledger) == 0:
+            return False
+        return len(algo.ledger.Due(lambda ticker: self.engine.Securities[ticker].Price, algo.delta_band, self.engine.time.date())) > 0
+
+    #Minutes of the day where the VIX guard would fire, from the z-score state as of the start of the day
+    def VixMinutes(self, date):
+        algo = self.engine.algorithm
+        if not getattr(algo, "vix_indicator_on", False) or not algo.vix_zscore.IsReady:
+            return set()
+        bars = self.engine.equity_bars.get(algo.vix_symbol)
+        if bars is None or date not in bars.day_lookup:
+            return set()
+        i = bars.day_lookup[date]
+        start, end = bars.day_starts[i], bars.day_ends[i]
+        threshold = algo.vix_zscore.mean + (algo.vix_stdevs - MARGIN) * algo.vix_zscore.std
+        times = bars.times[start:end]
+        minutes = (times - times.astype("datetime64[D]")).astype(np.int64)
+        return set(minutes[bars.close[start:end] > threshold].tolist())
+
+    #Whether OnData must run at this minute
+    def Relevant(self, date, minute, vix_minutes):
+        if minute in vix_minutes:
+            return True
+        if minute == 15 * 60 + 40:
+            expiry = self.engine.algorithm.expiries.Next()
+            if expiry is not None and expiry <= date:
+                return True
+        if minute % 60 == 0 and any(self.HourRelevant(t, date, minute) for t in self.spreads):
+            return True
+        return self.StopRelevant() or self.HedgeRelevant()